@@ -0,0 +1,98 @@
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from pdf_compression import open_output, open_input, strip_compression_extension
+
+BINARY_FORMATS = ("msgpack", "cbor")
+
+# A binary output file carries the same schema as output.json, written as a
+# sequence of records: first the document header (every key except "pages"),
+# then one record per page. Images are stored as raw PNG bytes under "data"
+# instead of "base64", and coordinates stay native floats.
+
+
+def get_encoder(output_format):
+    """
+    Returns a function that encodes one record in the requested binary format.
+    """
+    if output_format == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack output requires the msgpack package (pip install msgpack)")
+        return msgpack.Packer(use_bin_type=True).pack
+    if output_format == "cbor":
+        if cbor2 is None:
+            raise RuntimeError("cbor output requires the cbor2 package (pip install cbor2)")
+        return cbor2.dumps
+    raise ValueError(f"Unknown binary format: {output_format}")
+
+
+def guess_format(path):
+    path = strip_compression_extension(path)
+    for output_format in BINARY_FORMATS:
+        if path.endswith("." + output_format):
+            return output_format
+    raise ValueError(f"Cannot guess binary format from file name: {path}")
+
+
+def write_header(f, header, encode):
+    f.write(encode({key: value for key, value in header.items() if key != "pages"}))
+
+
+def write_page(f, page_info, encode):
+    f.write(encode(page_info))
+
+
+def write_binary(json_data, output_path, output_format, compression=None, level=None):
+    """
+    Writes a generated document to a binary file, page by page.
+    """
+    encode = get_encoder(output_format)
+    with open_output(output_path, compression, level) as f:
+        write_header(f, json_data, encode)
+        for page_info in json_data["pages"]:
+            write_page(f, page_info, encode)
+
+
+def iter_records(input_path, output_format=None):
+    """
+    Yields the records of a binary file one by one: the header first, then every page.
+    """
+    output_format = output_format or guess_format(input_path)
+    get_encoder(output_format)  # Fail early if the package is missing
+
+    with open_input(input_path) as f:
+        if output_format == "msgpack":
+            yield from msgpack.Unpacker(f, raw=False)
+        else:
+            decoder = cbor2.CBORDecoder(f)
+            while True:
+                try:
+                    yield decoder.decode()
+                except cbor2.CBORDecodeEOF:
+                    break
+
+
+def iter_pages(input_path, output_format=None):
+    """
+    Yields the pages of a binary file without loading the whole document.
+    """
+    records = iter_records(input_path, output_format)
+    next(records, None)  # Skip the header
+    yield from records
+
+
+def read_binary(input_path, output_format=None):
+    """
+    Reads a binary file back into the same dictionary the JSON converters produce.
+    """
+    records = iter_records(input_path, output_format)
+    result = next(records)
+    result["pages"] = list(records)
+    return result
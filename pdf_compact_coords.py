@@ -0,0 +1,69 @@
+# Compact coordinates: run positions stored as integers in a fixed unit of 1/units of
+# a point (100 by default, i.e. the same 0.01 pt precision as the rounded floats).
+# Consecutive runs on the same baseline are grouped into a line that carries "y" once,
+# and each run keeps "dx", its x offset from the previous run of the line (the first
+# run's offset is from 0). A compact page has "lines" in place of "text":
+#   "lines": [{"y": 7050, "runs": [{"word": "Hello", ..., "dx": 7200}, {"word": "world", ..., "dx": 2810}]}]
+# and the document records the unit as "coords": {"unit": 100}.
+
+COORD_UNITS = 100
+
+
+def compact_runs(words, units=COORD_UNITS):
+    """
+    Groups runs into lines and quantizes their coordinates. Run order is preserved,
+    so expand_runs gives back the same runs (to the precision of the unit).
+    """
+    lines = []
+    prev_x = 0
+    for word_data in words:
+        x = round(word_data["x"] * units)
+        y = round(word_data["y"] * units)
+        if not lines or lines[-1]["y"] != y:
+            lines.append({"y": y, "runs": []})
+            prev_x = 0
+        run = {key: value for key, value in word_data.items() if key not in ("x", "y")}
+        run["dx"] = x - prev_x
+        prev_x = x
+        lines[-1]["runs"].append(run)
+    return lines
+
+
+def expand_runs(lines, units=COORD_UNITS):
+    """
+    Rebuilds the list of runs, with "x" and "y" in points, from compact lines.
+    """
+    words = []
+    for line in lines:
+        x = 0
+        y = round(line["y"] / units, 2)
+        for run in line["runs"]:
+            x += run["dx"]
+            word_data = {key: value for key, value in run.items() if key != "dx"}
+            word_data["x"] = round(x / units, 2)
+            word_data["y"] = y
+            words.append(word_data)
+    return words
+
+
+def compact_page(page_info, units=COORD_UNITS):
+    # Rebuilt key by key so that "lines" takes the place of "text"
+    return {
+        ("lines" if key == "text" else key): (compact_runs(value, units) if key == "text" else value)
+        for key, value in page_info.items()
+    }
+
+
+def expand_page(page_info, units=COORD_UNITS):
+    return {
+        ("text" if key == "lines" else key): (expand_runs(value, units) if key == "lines" else value)
+        for key, value in page_info.items()
+    }
+
+
+def get_coord_units(json_data):
+    """
+    Returns the unit of a document with compact coordinates, or None for plain coordinates.
+    """
+    coords = json_data.get("coords")
+    return coords["unit"] if coords else None
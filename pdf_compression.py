@@ -0,0 +1,116 @@
+import gzip
+import json
+import io
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Outputs are compressed while they are written, so a compressed file is produced in
+# the same single pass as the page-by-page writers, with no extra read of the result.
+
+COMPRESSIONS = ("gzip", "zstd")
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def parse_compression(value):
+    """
+    Parses a --compress option value, "gzip" or "zstd" optionally followed by ":LEVEL".
+    Returns (compression, level).
+    """
+    compression, _, level = value.partition(":")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    return compression, int(level) if level else None
+
+
+def guess_compression(path):
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def strip_compression_extension(path):
+    compression = guess_compression(path)
+    return path[:-len(COMPRESSION_EXTENSIONS[compression])] if compression else path
+
+
+def add_compression_extension(path, compression):
+    if compression is None or guess_compression(path) == compression:
+        return path
+    return path + COMPRESSION_EXTENSIONS[compression]
+
+
+def check_compression(compression):
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd compression requires the zstandard package (pip install zstandard)")
+
+
+def open_output(path, compression=None, level=None, text=False):
+    """
+    Opens a file for writing, compressing everything written to it when compression
+    is "gzip" or "zstd". With text=True the file takes str and encodes it as UTF-8.
+    """
+    check_compression(compression)
+    if compression == "gzip":
+        f = gzip.open(path, "wb", compresslevel=level or DEFAULT_LEVELS["gzip"])
+    elif compression == "zstd":
+        f = zstandard.ZstdCompressor(level=level or DEFAULT_LEVELS["zstd"]).stream_writer(open(path, "wb"))
+    else:
+        f = open(path, "wb")
+    return io.TextIOWrapper(f, encoding="utf-8", newline="") if text else f
+
+
+def open_input(path, compression=None):
+    """
+    Opens a file for binary reading, decompressing it when its name (or compression)
+    says it is gzip or zstd compressed.
+    """
+    compression = compression or guess_compression(path)
+    check_compression(compression)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    return open(path, "rb")
+
+
+def compress_bytes(data, compression, level=None):
+    check_compression(compression)
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=level or DEFAULT_LEVELS["gzip"])
+    return zstandard.ZstdCompressor(level=level or DEFAULT_LEVELS["zstd"]).compress(data)
+
+
+def decompress_bytes(data, compression):
+    check_compression(compression)
+    if compression == "gzip":
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def compress_payload(data, key, compression, level=None):
+    """
+    Returns a copy of a document where data[key] (the pages, usually) is stored as
+    compressed JSON bytes under key + "_z", with the compression named in "compression".
+    The other fields stay as they are, so they can still be queried.
+    """
+    payload = compress_bytes(json.dumps(data[key], separators=(",", ":")).encode("utf-8"), compression, level)
+    result = {name: value for name, value in data.items() if name != key}
+    result[key + "_z"] = payload
+    result["compression"] = compression
+    return result
+
+
+def expand_payload(data, key):
+    """
+    Reverses compress_payload.
+    """
+    if key + "_z" not in data:
+        return data
+    result = {name: value for name, value in data.items() if name not in (key + "_z", "compression")}
+    result[key] = json.loads(decompress_bytes(data[key + "_z"], data["compression"]))
+    return result
@@ -0,0 +1,380 @@
+import fitz  # PyMuPDF
+import pdfplumber
+import tempfile
+import base64
+import shutil
+import json
+import time
+import os
+from pdf_to_json import extract_text_from_page
+from pdf_images import IMAGE_THREADS, ImageEncoder, get_image_position
+from pdf_binary_output import get_encoder, write_header
+from pdf_word_index import create_index, add_output_page, write_index
+from pdf_page_templates import detect_templates, apply_templates
+from pdf_thumbnails import render_thumbnails, load_thumbnails
+from pdf_progress import start_event, page_event
+from pdf_memprofile import get_stage
+from pdf_compact_coords import compact_page, expand_runs, get_coord_units
+from pdf_compression import open_output, guess_compression, compress_payload
+from pdf_preflight import preflight
+
+try:
+    from pymongo import MongoClient
+except ImportError:
+    MongoClient = None
+
+# Output schemas, the same as the scripts of the same name:
+#   "json"              pdf_to_json.py                    (size, images, text runs)
+#   "text_with_format"  pdf_text_with_format_to_json.py   (size, text runs)
+#   "text"              pdf_text_without_format_to_json.py (plain text per page)
+MODES = ("json", "text_with_format", "text")
+PAGE_COUNT_KEYS = {"json": "page_count", "text_with_format": "overall_page_count", "text": "overall_page_count"}
+
+# Supported options (all optional):
+#   raw_images      keep images as PNG bytes under "data" instead of "base64" (for binary sinks)
+#   image_dpi       downsample images to this effective resolution
+#   thumbnail_size  add a page thumbnail of this size; thumbnail_dir is its cache (default "thumbnails")
+#   templates       move repeated headers/footers to document-level "templates" (reads all pages first)
+#   on_event        progress callback, see pdf_progress.py
+#   pdf_name        name reported for sources that are not paths (default "document.pdf")
+#   profiler        a pdf_memprofile.MemoryProfiler to measure memory per page and stage
+#   image_threads   threads encoding images while text is extracted (default IMAGE_THREADS, 1 for none)
+#   compact_coords  store run coordinates as integers in 1/N points, see pdf_compact_coords.py
+#   preflight       check the document first (PreflightError if it cannot be converted) and
+#                   skip the character pipeline on pages without text, see pdf_preflight.py
+
+
+class ConversionResult:
+    """
+    A converted document: header fields (pdf_name, metadata, page count) available
+    immediately in `header`, and `pages`, an iterator that extracts each page only
+    when it is requested. Close it (or use it as a context manager) when done.
+    """
+
+    def __init__(self, source, mode="json", options=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        self.mode = mode
+        self.options = options or {}
+        self.pdf_path, pdf_name, self.temp_path = resolve_source(source, self.options.get("pdf_name"))
+        self.preflight = None
+        try:
+            if self.options.get("preflight"):
+                self.preflight = preflight(self.pdf_path)
+            self.doc = fitz.open(self.pdf_path)
+        except Exception:
+            # close() is never reached, so the spooled copy of bytes input goes here
+            if self.temp_path:
+                os.remove(self.temp_path)
+            raise
+
+        self.header = {"pdf_name": pdf_name}
+        if mode != "text":
+            self.header["metadata"] = self.doc.metadata
+        self.header[PAGE_COUNT_KEYS[mode]] = len(self.doc)
+        # Kept apart from self.pages, which may wrap it, so close() can stop extraction
+        self.page_generator = self.iter_pages()
+        self.pages = self.page_generator
+
+        if self.options.get("templates") and mode != "text":
+            # Templates need every page up front, so this option gives up laziness
+            pages = list(self.pages)
+            templates = detect_templates(pages)
+            self.header["templates"] = templates
+            self.pages = iter(apply_templates(pages, templates))
+
+        units = self.options.get("compact_coords")
+        if units and mode != "text":
+            self.header["coords"] = {"unit": units}
+            self.pages = (compact_page(page_info, units) for page_info in self.pages)
+
+    def iter_pages(self):
+        options = self.options
+        on_event = options.get("on_event")
+        stage = get_stage(options.get("profiler"))
+        start_time = time.time()
+        page_count = len(self.doc)
+        # Images being encoded, by page: each page starts its own images and those of the
+        # next page before extracting its text, and collects its images after it
+        submitted = {}
+
+        thumbnails = None
+        if options.get("thumbnail_size") and self.mode != "text":
+            thumbnail_paths = render_thumbnails(self.pdf_path, options.get("thumbnail_dir", "thumbnails"), options["thumbnail_size"])
+            thumbnails = load_thumbnails(thumbnail_paths, raw=options.get("raw_images", False))
+
+        if on_event:
+            on_event(start_event(self.header["pdf_name"], page_count))
+
+        image_threads = options.get("image_threads", IMAGE_THREADS) if self.mode == "json" else 1
+        with pdfplumber.open(self.pdf_path) as pdf, ImageEncoder(image_threads) as encoder:
+            for page_number, page in enumerate(pdf.pages):
+                page_start_time = time.time()
+                # Without a preflight every page goes through every stage
+                page_check = self.preflight["pages"][page_number] if self.preflight else {"chars": 1, "images": 1}
+                if self.mode == "json":
+                    with stage("images", page_number):
+                        for next_page in (page_number, page_number + 1):
+                            if next_page < page_count and next_page not in submitted and (not self.preflight or self.preflight["pages"][next_page]["images"]):
+                                submitted[next_page] = encoder.submit_page(self.doc, self.doc[next_page], options.get("image_dpi"))
+                if self.mode == "text":
+                    with stage("text", page_number):
+                        page_info = {"text": page.extract_text() if page_check["chars"] else ""}
+                    words, images = [], []
+                else:
+                    words = []
+                    if page_check["chars"]:
+                        with stage("layout", page_number):
+                            # pdfplumber parses the page layout on first access to its characters
+                            page.chars
+                        with stage("words", page_number):
+                            words = extract_text_from_page(page)
+                    images = []
+                    if self.mode == "json" and page_check["images"]:
+                        with stage("images", page_number):
+                            images = join_page_images(submitted.pop(page_number), options.get("raw_images", False))
+                    page_info = {"size": {"width": round(page.width, 2), "height": round(page.height, 2)}}
+                    if self.mode == "json":
+                        page_info["images"] = images
+                    page_info["text"] = words
+                    if thumbnails:
+                        page_info["thumbnail"] = thumbnails[page_number]
+                # Drop the parsed layout so memory stays flat on long documents
+                page.close()
+
+                if on_event:
+                    on_event(page_event(page_number, page_count, time.time() - page_start_time, start_time, words, images))
+                yield page_info
+
+    def close(self):
+        # Releases pdfplumber and the image encoder of a partly read document
+        self.page_generator.close()
+        self.doc.close()
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def to_dict(self):
+        """
+        Reads the remaining pages and returns the whole document as one dictionary.
+        """
+        return {**self.header, "pages": list(self.pages)}
+
+
+def resolve_source(source, pdf_name=None):
+    """
+    Returns (pdf_path, pdf_name, temp_path) for a path, bytes, or a binary file object.
+    Bytes and file objects are spooled to a temporary file so that both PyMuPDF and
+    pdfplumber read the same file instead of each keeping a copy in memory.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        pdf_path = os.fspath(source)
+        return pdf_path, pdf_name or os.path.basename(pdf_path), None
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            temp_file.write(source)
+        else:
+            shutil.copyfileobj(source, temp_file, 1 << 20)
+    return temp_file.name, pdf_name or "document.pdf", temp_file.name
+
+
+def join_page_images(submitted, raw_images=False):
+    """
+    Waits for the images of a page started with ImageEncoder.submit_page and returns
+    them in drawing order, as PNG bytes under "data" or Base64 under "base64".
+    """
+    images = []
+    for placement, future in submitted:
+        png_bytes = future.result()
+        pdf_x0, pdf_y0, img_width, img_height = get_image_position(placement)
+        images.append({
+            **({"data": png_bytes} if raw_images else {"base64": base64.b64encode(png_bytes).decode("utf-8")}),
+            "position": {
+                "x0": pdf_x0,
+                "y0": pdf_y0,
+                "width": img_width,
+                "height": img_height
+            }
+        })
+    return images
+
+
+def convert(source, mode="json", options=None):
+    """
+    Converts a PDF given as a path, bytes or a binary file object.
+    Returns a ConversionResult whose pages are extracted lazily as they are read;
+    pass it to write_result to stream it into one or more sinks.
+    """
+    return ConversionResult(source, mode, options)
+
+
+def write_result(result, *sinks):
+    """
+    Streams a conversion into the given sinks page by page, then closes it.
+    """
+    stage = get_stage(result.options.get("profiler"))
+    try:
+        for sink in sinks:
+            sink.open(result.header)
+        for page_number, page_info in enumerate(result.pages):
+            with stage("write", page_number):
+                for sink in sinks:
+                    sink.write_page(page_number, page_info)
+        with stage("close"):
+            for sink in sinks:
+                sink.close()
+    finally:
+        result.close()
+
+
+def encode_page(page_info, output_format="json", encode=None, indent=4):
+    """
+    Encodes one page exactly as FileSink writes it, so that pages can be serialized
+    elsewhere (e.g. in worker processes) and appended with FileSink.write_encoded.
+    """
+    if output_format != "json":
+        return (encode or get_encoder(output_format))(page_info)
+    if indent is None:
+        return json.dumps(page_info, separators=(",", ":")).encode("utf-8")
+    prefix = " " * (2 * indent)
+    return (prefix + json.dumps(page_info, indent=indent).replace("\n", "\n" + prefix)).encode("utf-8")
+
+
+# Sinks receive open(header), write_page(page_number, page_info) for every page, then close()
+
+class FileSink:
+    """
+    Writes the document to a file as it is converted: JSON identical to what
+    json.dumps(document, indent=indent) gives (with indent=None, without any whitespace),
+    or a binary format from pdf_binary_output. With compression ("gzip" or "zstd", by
+    default guessed from a .gz/.zst output path) the file is compressed as it is written.
+    """
+
+    def __init__(self, output_path, output_format="json", indent=4, compression=None, level=None):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.indent = indent
+        self.compression = compression or guess_compression(output_path)
+        self.level = level
+
+    def open(self, header):
+        self.pages_written = 0
+        self.encode = None
+        self.f = open_output(self.output_path, self.compression, self.level)
+        if self.output_format != "json":
+            self.encode = get_encoder(self.output_format)
+            write_header(self.f, header, self.encode)
+        elif self.indent is None:
+            self.f.write((json.dumps(header, separators=(",", ":"))[:-1] + ',"pages":[').encode("utf-8"))
+        else:
+            self.f.write((json.dumps(header, indent=self.indent)[:-2] + ",\n" + " " * self.indent + '"pages": [').encode("utf-8"))
+
+    def write_page(self, page_number, page_info):
+        self.write_encoded(encode_page(page_info, self.output_format, self.encode, self.indent))
+
+    def write_encoded(self, page_bytes=None, fragment_path=None):
+        """
+        Appends a page already encoded with encode_page, given as bytes or as a file.
+        """
+        if self.output_format == "json":
+            separator = "," if self.pages_written else ""
+            self.f.write((separator + ("" if self.indent is None else "\n")).encode("utf-8"))
+        if fragment_path is None:
+            self.f.write(page_bytes)
+        else:
+            with open(fragment_path, "rb") as fragment:
+                shutil.copyfileobj(fragment, self.f, 1 << 20)
+        self.pages_written += 1
+
+    def close(self):
+        if self.output_format == "json":
+            if self.indent is None:
+                self.f.write(b"]}")
+            else:
+                self.f.write(("\n" + " " * self.indent + "]\n}" if self.pages_written else "]\n}").encode("utf-8"))
+        self.f.close()
+
+
+class CallbackSink:
+    """
+    Calls on_page(page_number, page_info) for every page, and optionally on_open(header) and on_close().
+    """
+
+    def __init__(self, on_page, on_open=None, on_close=None):
+        self.on_page = on_page
+        self.on_open = on_open
+        self.on_close = on_close
+
+    def open(self, header):
+        if self.on_open:
+            self.on_open(header)
+
+    def write_page(self, page_number, page_info):
+        self.on_page(page_number, page_info)
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+
+
+class MongoSink:
+    """
+    Inserts the document into a MongoDB collection once all pages are converted.
+    extra_fields (e.g. {"userId": ...}) are added to the stored document. With compression,
+    the pages are stored as one compressed binary payload (see pdf_compression.compress_payload).
+    """
+
+    def __init__(self, mongo_uri, db_name, collection_name, extra_fields=None, compression=None, level=None):
+        if MongoClient is None:
+            raise RuntimeError("MongoSink requires the pymongo package (pip install pymongo)")
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.extra_fields = extra_fields or {}
+        self.compression = compression
+        self.level = level
+        self.inserted_id = None
+
+    def open(self, header):
+        self.document = {**header, "pages": []}
+
+    def write_page(self, page_number, page_info):
+        self.document["pages"].append(page_info)
+
+    def close(self):
+        document = {**self.document, **self.extra_fields}
+        if self.compression:
+            document = compress_payload(document, "pages", self.compression, self.level)
+        client = MongoClient(self.mongo_uri)
+        try:
+            result = client[self.db_name][self.collection_name].insert_one(document)
+            self.inserted_id = result.inserted_id
+        finally:
+            client.close()
+
+
+class IndexSink:
+    """
+    Builds the word index sidecar (see pdf_word_index.py) while pages are converted.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+
+    def open(self, header):
+        self.index = create_index()
+        self.templates = header.get("templates")
+        self.units = get_coord_units(header)
+
+    def write_page(self, page_number, page_info):
+        words = expand_runs(page_info["lines"], self.units) if self.units else page_info["text"]
+        add_output_page(self.index, page_number, words, page_info.get("templates"), self.templates)
+
+    def close(self):
+        write_index(self.index, self.index_path)
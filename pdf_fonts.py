@@ -0,0 +1,134 @@
+import fitz  # PyMuPDF
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:
+    TTFont = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Converted fonts are kept in a cache shared by every document, keyed by the SHA-256 of
+# the embedded font program: reports made from the same template embed the same fonts
+# (often the same subsets), so each one is converted once and then read back.
+# An entry is <hash>.json, describing the result, plus the converted font <hash>.<ext>
+# when the font is usable on the web. Fonts that are not (bare CFF, Type 1, TrueType
+# without a Unicode cmap) are cached too, with "format": null, so they are not retried.
+# Entries record the converter that made them and are redone by another one, so fonts
+# checked without fontTools are converted again once it is installed.
+FONT_CACHE_DIR = os.environ.get("PDF_FONT_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "pdf-to-html", "fonts")
+
+# Embedded font programs a browser can load as they are, by PyMuPDF extension
+WEB_FORMATS = {"ttf": "truetype", "otf": "opentype"}
+FONT_EXTENSIONS = {"truetype": "ttf", "opentype": "otf", "woff": "woff", "woff2": "woff2"}
+FONT_MIME_TYPES = {"truetype": "font/ttf", "opentype": "font/otf", "woff": "font/woff", "woff2": "font/woff2"}
+FONT_CONVERTER = "fonttools" if TTFont else "pymupdf"
+
+
+def convert_font(font_bytes, ext):
+    """
+    Converts an embedded font program to a web font. TrueType and OpenType fonts are
+    checked for a Unicode cmap (the HTML carries Unicode text, so a font without one
+    would show the wrong glyphs). With fontTools installed they are saved as WOFF2, or
+    WOFF without brotli; without it, the check is done by PyMuPDF and they are used
+    unchanged.
+    Returns (font bytes, CSS format), or (None, None) if the font cannot be used.
+    """
+    if ext not in WEB_FORMATS:
+        return None, None
+    if TTFont is None:
+        try:
+            # Subsets embedded for Identity-H text usually map no code point at all
+            if not fitz.Font(fontbuffer=font_bytes).valid_codepoints():
+                return None, None
+        except Exception:
+            return None, None
+        return font_bytes, WEB_FORMATS[ext]
+
+    try:
+        font = TTFont(io.BytesIO(font_bytes))
+        if not font.getBestCmap():
+            return None, None
+        font.flavor = "woff2" if brotli else "woff"
+        output = io.BytesIO()
+        font.save(output)
+    except Exception:
+        return None, None
+    return output.getvalue(), font.flavor
+
+
+def write_atomic(path, data):
+    # Several processes may convert the same font at once; each writes a whole file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def get_cached_font(font_bytes, ext, cache_dir=FONT_CACHE_DIR):
+    """
+    Returns the cache entry of a font program, converting and storing it on a miss.
+    The entry is a dictionary with "hash", "format" (None when the font is not usable),
+    "path", "converter" and "cached" (whether it was already in the cache).
+    """
+    font_hash = hashlib.sha256(font_bytes).hexdigest()
+    entry_path = os.path.join(cache_dir, font_hash + ".json")
+    if os.path.exists(entry_path):
+        with open(entry_path, encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("converter") == FONT_CONVERTER and (entry["format"] is None or os.path.exists(entry["path"])):
+            return {**entry, "cached": True}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    web_bytes, css_format = convert_font(font_bytes, ext)
+    entry = {"hash": font_hash, "format": css_format, "path": None, "converter": FONT_CONVERTER}
+    if css_format:
+        entry["path"] = os.path.join(cache_dir, f"{font_hash}.{FONT_EXTENSIONS[css_format]}")
+        write_atomic(entry["path"], web_bytes)
+    write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+    return {**entry, "cached": False}
+
+
+def extract_fonts(pdf_path, cache_dir=FONT_CACHE_DIR):
+    """
+    Extracts the fonts embedded in a PDF, once per xref, through the font cache.
+    Returns one dictionary per usable font with "name" (the PDF base font name, as
+    pdfplumber reports it for the characters), "family" (a CSS family name unique to
+    the font program), "format", "path" and "cached". Fonts sharing a program share
+    a family.
+    """
+    fonts = []
+    seen_xrefs = set()
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for xref, ext, font_type, basefont, name, encoding in page.get_fonts():
+                if xref in seen_xrefs or ext == "n/a":
+                    continue
+                seen_xrefs.add(xref)
+                _, ext, _, font_bytes = doc.extract_font(xref)
+                if not font_bytes:
+                    continue
+                entry = get_cached_font(font_bytes, ext, cache_dir)
+                if entry["format"]:
+                    fonts.append({
+                        "name": basefont,
+                        "family": "f-" + entry["hash"][:16],
+                        "format": entry["format"],
+                        "path": entry["path"],
+                        "cached": entry["cached"]
+                    })
+    return fonts
+
+
+def get_font_data_uri(font):
+    with open(font["path"], "rb") as f:
+        font_base64 = base64.b64encode(f.read()).decode("ascii")
+    return f"data:{FONT_MIME_TYPES[font['format']]};base64,{font_base64}"
@@ -0,0 +1,226 @@
+import fitz  # PyMuPDF
+from PIL import Image
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, Future
+import base64
+import math
+import os
+
+# Images are located and decoded with PyMuPDF alone: get_image_info returns the
+# bbox, transform and xref of every placement in one pass, so there is no need
+# to match pdfplumber's page.images against PyMuPDF's image list by index.
+
+# Threads encoding images while text is extracted (see ImageEncoder)
+IMAGE_THREADS = min(4, os.cpu_count() or 1)
+
+
+def get_page_image_placements(fitz_page):
+    """
+    Returns the images drawn on a page, in drawing order, as dictionaries with
+    "xref", "smask", "bbox" and "transform". An image placed several times appears
+    once per placement; inline images have xref 0.
+    """
+    smasks = {img[0]: img[1] for img in fitz_page.get_images()}
+    placements = []
+    for info in fitz_page.get_image_info(xrefs=True):
+        placements.append({
+            "xref": info["xref"],
+            "smask": smasks.get(info["xref"], 0),
+            "bbox": tuple(info["bbox"]),
+            "transform": tuple(info["transform"])
+        })
+    return placements
+
+
+def render_without_text(doc, fitz_page, clip):
+    """
+    Renders an area of a page with its text removed, from a one-page copy of the document.
+    """
+    with fitz.open() as copy:
+        copy.insert_pdf(doc, from_page=fitz_page.number, to_page=fitz_page.number)
+        page = copy[0]
+        page.add_redact_annot(page.rect, fill=False)
+        page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE, text=fitz.PDF_REDACT_TEXT_REMOVE)
+        return page.get_pixmap(clip=clip)
+
+
+def get_image_pixmap(doc, fitz_page, placement):
+    if not placement["xref"]:
+        # Inline images have no xref to decode, so render the area they cover. Text over
+        # them is left out, as it is output as text; vector art over them is still rendered.
+        if fitz_page.get_text("words", clip=placement["bbox"]):
+            return render_without_text(doc, fitz_page, placement["bbox"])
+        return fitz_page.get_pixmap(clip=placement["bbox"])
+
+    pix = fitz.Pixmap(doc, placement["xref"])
+    if placement["smask"]:  # If there is a mask
+        mask = fitz.Pixmap(doc, placement["smask"])
+        pix = fitz.Pixmap(pix, mask)
+    if pix.colorspace and pix.colorspace.n > 3:
+        # PNG has no CMYK, convert to RGB first
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return pix
+
+
+def get_target_size(placement, target_dpi):
+    """
+    Returns the pixel size an image needs to be shown at target_dpi in its placement box.
+    """
+    x0, y0, x1, y1 = placement["bbox"]
+    return max(1, math.ceil(abs(x1 - x0) / 72 * target_dpi)), max(1, math.ceil(abs(y1 - y0) / 72 * target_dpi))
+
+
+def get_scale(width, height, target_size):
+    # Keep the aspect ratio and never go below the target in either direction
+    return max(target_size[0] / width, target_size[1] / height)
+
+
+def prepare_image(doc, fitz_page, placement, target_dpi=None):
+    """
+    Does the PyMuPDF part of getting an image as PNG: decoding the pixmap and halving
+    it, or reading the JPEG stream when PIL can decode it at a reduced size directly.
+    Returns an encoding job holding only bytes and sizes, for encode_image.
+    """
+    if target_dpi:
+        target_size = get_target_size(placement, target_dpi)
+        if placement["xref"] and not placement["smask"]:
+            image_info = doc.extract_image(placement["xref"])
+            # PIL draft mode scales plain RGB/grayscale JPEGs during DCT decoding
+            if image_info["ext"] in ("jpeg", "jpg") and Image.open(BytesIO(image_info["image"])).mode in ("RGB", "L"):
+                return {"jpeg": image_info["image"], "target_size": target_size}
+
+    pix = get_image_pixmap(doc, fitz_page, placement)
+    resize = None
+    if target_dpi:
+        scale = get_scale(pix.width, pix.height, target_size)
+        if scale < 1:
+            # Halve the pixmap in place as often as possible, then finish with PIL if still too large
+            halvings = int(math.log2(1 / scale))
+            if halvings:
+                pix.shrink(halvings)
+                scale *= 2 ** halvings
+            if scale <= 0.75:
+                resize = (round(pix.width * scale), round(pix.height * scale))
+    # MuPDF stores alpha premultiplied ("La", "RGBa"), PNG wants it straight
+    mode = {1: "L", 2: "La", 3: "RGB", 4: "RGBa"}[pix.n]
+    return {"mode": mode, "size": (pix.width, pix.height), "samples": pix.samples, "resize": resize}
+
+
+def encode_image(job):
+    """
+    Encodes a job from prepare_image as PNG bytes. This uses PIL only, which releases
+    the GIL while it decodes, resizes and compresses, so it can run on any thread.
+    """
+    if "jpeg" in job:
+        img_pil = Image.open(BytesIO(job["jpeg"]))
+        img_pil.draft(img_pil.mode, job["target_size"])
+        scale = get_scale(img_pil.width, img_pil.height, job["target_size"])
+        if scale < 1:
+            img_pil = img_pil.resize((round(img_pil.width * scale), round(img_pil.height * scale)), Image.Resampling.BOX)
+    else:
+        img_pil = Image.frombytes(job["mode"], job["size"], job["samples"]).convert(job["mode"].upper())
+        if job["resize"]:
+            img_pil = img_pil.resize(job["resize"], Image.Resampling.BOX)
+    buffered = BytesIO()
+    img_pil.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def get_image_png(doc, fitz_page, placement, target_dpi=None, cache=None):
+    """
+    Retrieves an image placed on the page as PNG bytes. With target_dpi, images larger
+    than needed for their placement box are downsampled to that effective resolution.
+    cache is an optional dict reused across pages of a document, keyed by (xref, size).
+    """
+    cache_key = (placement["xref"], get_target_size(placement, target_dpi)) if target_dpi and placement["xref"] else None
+    if cache is not None and cache_key in cache:
+        return cache[cache_key]
+
+    png_bytes = encode_image(prepare_image(doc, fitz_page, placement, target_dpi))
+    if cache is not None and cache_key:
+        cache[cache_key] = png_bytes
+    return png_bytes
+
+
+class ImageEncoder:
+    """
+    Encodes images on a thread pool while the caller goes on with other work, typically
+    text extraction. submit() runs prepare_image on the calling thread (PyMuPDF is not
+    thread safe) and returns a future of the PNG bytes; futures are joined in page order
+    by the caller. Like the image cache of get_image_png, identical downsampled images
+    of a document share one future. With threads <= 1 images are encoded on submit.
+    An executor shared by several encoders can be given instead (see get_image_executor).
+    """
+
+    def __init__(self, threads=IMAGE_THREADS, executor=None):
+        self.own_executor = executor is None and threads > 1
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="image") if self.own_executor else executor
+        self.cache = {}
+
+    def submit(self, doc, fitz_page, placement, target_dpi=None):
+        cache_key = (placement["xref"], get_target_size(placement, target_dpi)) if target_dpi and placement["xref"] else None
+        if cache_key in self.cache:
+            return self.cache[cache_key]
+
+        job = prepare_image(doc, fitz_page, placement, target_dpi)
+        future = None
+        if self.executor:
+            try:
+                future = self.executor.submit(encode_image, job)
+            except RuntimeError:
+                # No thread could be started (e.g. under a worker memory limit)
+                pass
+        if future is None:
+            future = Future()
+            future.set_result(encode_image(job))
+        if cache_key:
+            self.cache[cache_key] = future
+        return future
+
+    def submit_page(self, doc, fitz_page, target_dpi=None):
+        """
+        Starts encoding every image placed on a page. Returns (placement, future) pairs
+        in drawing order.
+        """
+        return [(placement, self.submit(doc, fitz_page, placement, target_dpi)) for placement in get_page_image_placements(fitz_page)]
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Per-process executor shared by the encoders of every page a worker process handles
+executor_cache = {}
+
+
+def get_image_executor(threads=IMAGE_THREADS):
+    """
+    Returns the image thread pool of this process, creating it on first use. A process
+    forked from one that had a pool gets its own, as threads do not survive a fork.
+    """
+    if threads <= 1:
+        return None
+    if executor_cache.get("pid") != os.getpid():
+        executor_cache.update(pid=os.getpid(), executor=ThreadPoolExecutor(threads, thread_name_prefix="image"))
+    return executor_cache["executor"]
+
+
+def get_image_base64(doc, fitz_page, placement, target_dpi=None, cache=None):
+    """
+    Retrieves an image placed on the page and converts it to Base64 format.
+    """
+    return base64.b64encode(get_image_png(doc, fitz_page, placement, target_dpi, cache)).decode("utf-8")
+
+
+def get_image_position(placement):
+    """
+    Returns the position of an image placement as (x0, y0, width, height).
+    """
+    x0, y0, x1, y1 = placement["bbox"]
+    return round(x0, 2), round(y0, 2), round(abs(x1 - x0), 2), round(abs(y1 - y0), 2)
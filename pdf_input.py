@@ -0,0 +1,254 @@
+import contextlib
+import tempfile
+import tarfile
+import shutil
+import struct
+import json
+import mmap
+import stat
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    from pymongo import MongoClient
+    from pymongo.errors import BulkWriteError
+except ImportError:
+    MongoClient = BulkWriteError = None
+
+SPOOL_CHUNK_SIZE = 1 << 20
+
+# Multi-document streams carry many PDFs through one pipe, each with its own header
+# ({"userId": ..., "file_name": ...}), so one warm process can convert a whole batch:
+#   "framed"  records of a 4-byte big-endian header length, the header as UTF-8 JSON,
+#             an 8-byte big-endian PDF length and the PDF bytes (see write_framed_document)
+#   "tar"     a tar stream of the PDFs, each named "<userId>/<file name>"
+STREAM_FORMATS = ("framed", "tar")
+# Documents of a multi-document stream are saved with insert_many, this many at a time
+BATCH_SIZE = 16
+
+
+@contextlib.contextmanager
+def open_pdf_input(source="-"):
+    """
+    Opens a PDF given as a file path, "-" for stdin, or a file descriptor (an int or "fd:N").
+    Yields (pdf_path, pdf_map): a path PyMuPDF can open and a read-only memory map of
+    the same file for pdfplumber, so neither library needs its own copy of the document.
+    Pipes are spooled to a temporary file in chunks instead of being read into memory;
+    regular files and file descriptors are mapped in place.
+    """
+    temp_path = None
+    if source == "-":
+        fd = sys.stdin.buffer.fileno()
+    elif isinstance(source, int):
+        fd = source
+    elif isinstance(source, str) and source.startswith("fd:"):
+        fd = int(source[3:])
+    else:
+        fd = None
+
+    try:
+        if fd is None:
+            pdf_path = source
+        elif stat.S_ISREG(os.fstat(fd).st_mode):
+            # A redirected regular file can be reopened and mapped without copying
+            pdf_path = f"/dev/fd/{fd}"
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+                temp_path = temp_file.name
+                with os.fdopen(os.dup(fd), "rb") as pipe:
+                    shutil.copyfileobj(pipe, temp_file, SPOOL_CHUNK_SIZE)
+            pdf_path = temp_path
+
+        with open(pdf_path, "rb") as f:
+            # An empty file cannot be mapped (nor be a PDF)
+            if not os.fstat(f.fileno()).st_size:
+                raise ValueError("The PDF input is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
+                yield pdf_path, pdf_map
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+@contextlib.contextmanager
+def open_input_stream(source="-"):
+    """
+    Opens a file path, "-" for stdin, or a file descriptor (an int or "fd:N") as a
+    binary stream read from start to end.
+    """
+    if source == "-":
+        yield sys.stdin.buffer
+    elif isinstance(source, int) or (isinstance(source, str) and source.startswith("fd:")):
+        fd = source if isinstance(source, int) else int(source[3:])
+        with os.fdopen(os.dup(fd), "rb") as f:
+            yield f
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+@contextlib.contextmanager
+def spool_document(stream, length=None):
+    """
+    Copies the next length bytes of a stream (or all of it) to a temporary file, and
+    yields (pdf_path, pdf_map) like open_pdf_input.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        temp_path = temp_file.name
+        try:
+            if length is None:
+                shutil.copyfileobj(stream, temp_file, SPOOL_CHUNK_SIZE)
+            else:
+                remaining = length
+                while remaining:
+                    chunk = stream.read(min(remaining, SPOOL_CHUNK_SIZE))
+                    if not chunk:
+                        raise ValueError(f"Stream ended {remaining} bytes before the end of a document")
+                    temp_file.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_path)
+            raise
+
+    try:
+        with open(temp_path, "rb") as f:
+            # An empty file cannot be mapped; it is left to the PDF libraries to reject
+            pdf_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+            try:
+                yield temp_path, pdf_map
+            finally:
+                if pdf_map:
+                    pdf_map.close()
+    finally:
+        os.remove(temp_path)
+
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Stream ended inside a document header")
+    return data
+
+
+def iter_input_documents(source="-", stream_format="framed"):
+    """
+    Reads a multi-document stream (see STREAM_FORMATS) and yields (header, pdf_path,
+    pdf_map) for each document in turn. Every document is spooled to its own temporary
+    file, removed when the next one is read.
+    """
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format: {stream_format}")
+
+    with open_input_stream(source) as stream:
+        if stream_format == "framed":
+            while True:
+                prefix = stream.read(4)
+                if not prefix:
+                    return
+                if len(prefix) != 4:
+                    raise ValueError("Stream ended inside a document header")
+                header = json.loads(read_exactly(stream, struct.unpack(">I", prefix)[0]).decode("utf-8"))
+                length = struct.unpack(">Q", read_exactly(stream, 8))[0]
+                with spool_document(stream, length) as (pdf_path, pdf_map):
+                    yield header, pdf_path, pdf_map
+        else:
+            with tarfile.open(fileobj=stream, mode="r|*") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    user_id, _, file_name = member.name.removeprefix("./").partition("/")
+                    if not file_name:
+                        raise ValueError(f"Tar member is not named <userId>/<file name>: {member.name}")
+                    with spool_document(tar.extractfile(member)) as (pdf_path, pdf_map):
+                        yield {"userId": user_id, "file_name": file_name}, pdf_path, pdf_map
+
+
+def write_framed_document(f, header, pdf_bytes):
+    """
+    Writes one document of a "framed" stream, for uploaders.
+    """
+    header_bytes = json.dumps(header).encode("utf-8")
+    f.write(struct.pack(">I", len(header_bytes)) + header_bytes + struct.pack(">Q", len(pdf_bytes)))
+    f.write(pdf_bytes)
+
+
+def save_batch_to_mongodb(collection, batch, name_key):
+    """
+    Inserts a batch of documents; a document the server refuses does not stop the others,
+    and is reported by its name_key field. Returns the number of documents saved.
+    """
+    try:
+        saved = len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        saved = e.details["nInserted"]
+        for error in e.details["writeErrors"]:
+            print(f"{batch[error['index']][name_key]}: not saved ({error['errmsg']})", file=sys.stderr)
+    print(f"Saved {saved} of {len(batch)} documents to MongoDB")
+    return saved
+
+
+def ingest_document_stream(input_source, stream_format, convert_document, mongo_uri, db_name, collection_name, name_key, batch_size=BATCH_SIZE):
+    """
+    Converts every document of a multi-document stream in this process with
+    convert_document(header, pdf_path, pdf_map), which returns the document to store,
+    and saves them in batches over a single MongoDB connection. A document that cannot
+    be converted or saved is reported and skipped. A stream that turns out truncated or
+    corrupt is reported and counted as one failed document, after which the documents
+    converted before it are still saved. Returns (saved, failed) document counts.
+    """
+    if MongoClient is None:
+        raise RuntimeError("Saving to MongoDB requires the pymongo package (pip install pymongo)")
+    saved = failed = queued = 0
+    batch = []
+    client = MongoClient(mongo_uri)
+    try:
+        collection = client[db_name][collection_name]
+        with contextlib.closing(iter_input_documents(input_source, stream_format)) as documents:
+            while True:
+                # Only errors reading the stream are caught here, not those saving to MongoDB
+                try:
+                    header, pdf_path, pdf_map = next(documents)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    print(f"Input stream unreadable after {queued + failed} documents ({type(e).__name__}: {e})", file=sys.stderr)
+                    failed += 1
+                    break
+                try:
+                    batch.append(convert_document(header, pdf_path, pdf_map))
+                except Exception as e:
+                    print(f"{header.get('file_name')}: conversion failed ({type(e).__name__}: {e})", file=sys.stderr)
+                    failed += 1
+                    continue
+                queued += 1
+                if len(batch) >= batch_size:
+                    saved += save_batch_to_mongodb(collection, batch, name_key)
+                    batch = []
+        if batch:
+            saved += save_batch_to_mongodb(collection, batch, name_key)
+    finally:
+        client.close()
+    # Documents the server refused count as failed
+    return saved, failed + queued - saved
+
+
+def get_peak_memory_mb():
+    """
+    Returns the peak resident memory of this process in megabytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def report_input_memory(pdf_map):
+    peak_memory = get_peak_memory_mb()
+    print(f"Input size: {round(len(pdf_map) / (1024 * 1024), 1)} MB, peak memory: {peak_memory} MB", file=sys.stderr)
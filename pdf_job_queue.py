@@ -0,0 +1,470 @@
+import contextlib
+import sqlite3
+import socket
+import signal
+import tempfile
+import shutil
+import sys
+import time
+import os
+import fitz  # PyMuPDF
+import pdfplumber
+from pdf_binary_output import BINARY_FORMATS
+from pdf_convert import FileSink
+from pdf_compression import guess_compression, open_output
+from pdf_to_json_multi_proc import process_page_with_budget, write_fragment, write_page_fragment, get_document_header, raise_budget_exceeded
+from pdf_to_html import HTML_TEMPLATE, process_page as process_page_html, generate_page_div, get_page_dimensions
+from pdf_images import ImageEncoder
+from pdf_preflight import PreflightError, open_checked
+
+# A queue shared by worker processes on any number of machines. Documents are split
+# into page-range jobs; a worker claims a job with a lease, writes every page of it as
+# an encoded fragment in "<output>.parts/", and marks it done. Jobs whose worker fails
+# are retried, and so are jobs whose lease expires (the worker died or lost the node).
+# Once every job of a document is done, a worker assembles the fragments in page order.
+#
+# The reference implementation is a SQLite file; the database, the PDFs and the output
+# directories must be on storage every worker can reach. SQLite locking over network
+# file systems is only as reliable as the file system's own locking.
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    pdf_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    image_dpi INTEGER,
+    page_timeout REAL,
+    status TEXT NOT NULL DEFAULT 'open',
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    first_page INTEGER NOT NULL,
+    last_page INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_expires);
+"""
+
+OUTPUT_FORMATS = ("json", "html") + BINARY_FORMATS
+PAGES_PER_JOB = 8
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+
+def open_queue(db_path):
+    # Autocommit mode; every multi-statement change takes the write lock with BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(QUEUE_SCHEMA)
+    return conn
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_fragment_dir(output_path):
+    return output_path + ".parts"
+
+
+def submit_document(conn, pdf_path, output_path, output_format="json", pages_per_job=PAGES_PER_JOB, image_dpi=None, page_timeout=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Adds a document to the queue as jobs of pages_per_job consecutive pages.
+    Paths are stored as absolute paths, so they must be valid on every worker.
+    Returns the document id.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    pdf_path, output_path = os.path.abspath(pdf_path), os.path.abspath(output_path)
+    # Unreadable or locked files are refused here instead of failing in every job
+    with open_checked(pdf_path) as doc:
+        page_count = len(doc)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        document_id = conn.execute(
+            "INSERT INTO documents (pdf_path, output_path, output_format, page_count, image_dpi, page_timeout, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (pdf_path, output_path, output_format, page_count, image_dpi, page_timeout, time.time())
+        ).lastrowid
+        for first_page in range(0, page_count, pages_per_job):
+            conn.execute(
+                "INSERT INTO jobs (document_id, first_page, last_page, max_attempts) VALUES (?, ?, ?, ?)",
+                (document_id, first_page, min(first_page + pages_per_job, page_count) - 1, max_attempts)
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return document_id
+
+
+def claim_job(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Leases the next pending job, or a leased job whose lease has expired.
+    Expired jobs that used up their attempts are marked failed instead.
+    Returns the job joined with its document, or None when there is nothing to do.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'lease expired') "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+            (now,)
+        )
+        job = conn.execute(
+            "SELECT jobs.*, documents.pdf_path, documents.output_path, documents.output_format, documents.image_dpi, documents.page_timeout "
+            "FROM jobs JOIN documents ON documents.id = jobs.document_id "
+            "WHERE jobs.status = 'pending' OR (jobs.status = 'leased' AND jobs.lease_expires < ?) "
+            "ORDER BY jobs.id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease_seconds, job["id"])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job
+
+
+def renew_lease(conn, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Extends a lease. Returns False if the job was taken over by another worker meanwhile.
+    """
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+        (time.time() + lease_seconds, job_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+
+def complete_job(conn, job_id, worker_id):
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'done', lease_expires = NULL, error = NULL WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+        (job_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+
+def fail_job(conn, job_id, worker_id, error):
+    """
+    Releases a job after an error: back to pending while it has attempts left, failed after that.
+    """
+    conn.execute(
+        "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+        "lease_owner = NULL, lease_expires = NULL, error = ? WHERE id = ? AND lease_owner = ?",
+        (error, job_id, worker_id)
+    )
+
+
+HTML_STRATEGIES = ("text", "raster")
+
+
+def iter_html_pages(job, page_numbers):
+    """
+    Yields (page_number, page_data, images_data) for every page of an HTML job, from a
+    single opening of its document. Like process_page_with_budget, each strategy in turn
+    gets page_timeout seconds (text and images, then the page as one image with a text
+    layer), and a page on which both fail is left empty.
+    """
+    use_timer = job["page_timeout"] and hasattr(signal, "setitimer")
+    with fitz.open(job["pdf_path"]) as doc, pdfplumber.open(job["pdf_path"]) as pdf, ImageEncoder() as encoder:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number]
+            images_data, page_data = [], {"page": page_number, "width": round(page.width, 2), "height": round(page.height, 2), "text": []}
+            for strategy in HTML_STRATEGIES:
+                try:
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_REAL, job["page_timeout"])
+                    submitted = encoder.submit_page(doc, doc[page_number], job["image_dpi"]) if strategy == "text" else []
+                    images_data, page_data = process_page_html(doc, page, strategy, submitted, image_dpi=job["image_dpi"])
+                except Exception as e:  # Includes PageBudgetExceeded and MemoryError
+                    print(f"Page {page_number + 1}: {strategy} strategy failed ({type(e).__name__}: {e})", file=sys.stderr)
+                    continue
+                finally:
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                break
+            # Drop the parsed layout so memory stays flat on long jobs
+            page.close()
+            yield page_number, page_data, images_data
+
+
+def run_job(conn, job, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Writes the fragments of every page of a leased job. Returns False if the lease was
+    lost on the way, in which case the job belongs to another worker and is left alone.
+    """
+    fragment_dir = get_fragment_dir(job["output_path"])
+    os.makedirs(fragment_dir, exist_ok=True)
+    page_numbers = list(range(job["first_page"], job["last_page"] + 1))
+
+    if job["output_format"] == "html":
+        pages = iter_html_pages(job, page_numbers)
+    else:
+        raw_images = job["output_format"] != "json"
+        pages = ((page_number, process_page_with_budget(page_number, job["pdf_path"], raw_images, job["page_timeout"], job["image_dpi"]), None)
+                 for page_number in page_numbers)
+    with contextlib.closing(pages):
+        for page_number, page_data, images_data in pages:
+            # Renewing before every page is published keeps long jobs alive, and a worker whose
+            # job was taken over stops without touching fragments that now belong to another
+            if not renew_lease(conn, job["id"], worker_id, lease_seconds):
+                return False
+            if job["output_format"] == "html":
+                write_fragment(os.path.join(fragment_dir, f"page-{page_number:05d}"), generate_page_div(page_data, images_data).encode("utf-8"))
+            else:
+                write_page_fragment(page_data, job["output_format"], fragment_dir)
+    return True
+
+
+class FinalizationLost(Exception):
+    pass
+
+
+def claim_finalization(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Picks a document whose jobs are all done and marks it as being finalized by worker_id,
+    so that only one worker assembles it; a finalization whose lease expired is picked up again.
+    Documents with a job that failed for good are marked failed. Returns the document or None.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE documents SET status = 'failed' WHERE status = 'open' AND EXISTS "
+            "(SELECT 1 FROM jobs WHERE jobs.document_id = documents.id AND jobs.status = 'failed')"
+        )
+        document = conn.execute(
+            "SELECT * FROM documents WHERE (status = 'open' OR (status = 'finalizing' AND lease_expires < ?)) AND NOT EXISTS "
+            "(SELECT 1 FROM jobs WHERE jobs.document_id = documents.id AND jobs.status != 'done') "
+            "ORDER BY id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if document is not None:
+            conn.execute("UPDATE documents SET status = 'finalizing', lease_owner = ?, lease_expires = ? WHERE id = ?", (worker_id, now + lease_seconds, document["id"]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return document
+
+
+def renew_finalization(conn, document_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Extends the lease of a finalization, raising FinalizationLost if the document was
+    taken over by another worker meanwhile.
+    """
+    cursor = conn.execute(
+        "UPDATE documents SET lease_expires = ? WHERE id = ? AND status = 'finalizing' AND lease_owner = ?",
+        (time.time() + lease_seconds, document_id, worker_id)
+    )
+    if cursor.rowcount != 1:
+        raise FinalizationLost(f"Document {document_id} is being finalized by another worker")
+
+
+def iter_fragment_paths(conn, document, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Yields the fragment paths of a document in page order, renewing the finalization
+    lease on the way (every tenth of a lease rather than for every fragment).
+    """
+    fragment_dir = get_fragment_dir(document["output_path"])
+    renewed = time.time()
+    for page_number in range(document["page_count"]):
+        if time.time() - renewed > lease_seconds / 10:
+            renew_finalization(conn, document["id"], worker_id, lease_seconds)
+            renewed = time.time()
+        yield os.path.join(fragment_dir, f"page-{page_number:05d}")
+
+
+def assemble_document(conn, document, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Concatenates the page fragments of a document into its output file, in page order.
+    Raises FinalizationLost, leaving the output and the fragments alone, if the
+    finalization is taken over by another worker on the way.
+    """
+    # Written next to the output under a name of its own and moved into place, so readers
+    # never see a partial file and two finalizers never write the same one
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(document["output_path"]), suffix=".tmp")
+    os.close(fd)
+    # A .gz/.zst output path gets its output compressed as it is assembled
+    compression = guess_compression(document["output_path"])
+
+    try:
+        if document["output_format"] == "html":
+            # The .page rule only gives a default size, the first page's: every page div
+            # carries its own size inline (see generate_page_div), so mixed sizes render right
+            page_width, page_height = get_page_dimensions(document["pdf_path"])
+            head, tail = HTML_TEMPLATE.split("{content}")
+            with open_output(temp_path, compression) as f:
+                f.write(head.format(page_width=page_width, page_height=page_height, template_styles="").encode("utf-8"))
+                for fragment_path in iter_fragment_paths(conn, document, worker_id, lease_seconds):
+                    with open(fragment_path, "rb") as fragment:
+                        shutil.copyfileobj(fragment, f, 1 << 20)
+                f.write(tail.encode("utf-8"))
+        else:
+            with fitz.open(document["pdf_path"]) as doc:
+                metadata = doc.metadata
+            sink = FileSink(temp_path, document["output_format"], compression=compression)
+            sink.open(get_document_header(document["pdf_path"], metadata, document["page_count"]))
+            for fragment_path in iter_fragment_paths(conn, document, worker_id, lease_seconds):
+                sink.write_encoded(fragment_path=fragment_path)
+            sink.close()
+        renew_finalization(conn, document["id"], worker_id, lease_seconds)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, document["output_path"])
+    shutil.rmtree(get_fragment_dir(document["output_path"]), ignore_errors=True)
+
+
+def finalize_document(conn, document, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Assembles a document claimed with claim_finalization and marks it done, or failed.
+    Returns False if it failed or was taken over by another worker, which then owns it.
+    """
+    try:
+        assemble_document(conn, document, worker_id, lease_seconds)
+    except FinalizationLost as e:
+        print(f"{e}, leaving it", file=sys.stderr)
+        return False
+    except Exception as e:
+        conn.execute("UPDATE documents SET status = 'failed' WHERE id = ? AND lease_owner = ?", (document["id"], worker_id))
+        print(f"Document {document['id']}: finalization failed ({type(e).__name__}: {e})", file=sys.stderr)
+        return False
+    cursor = conn.execute(
+        "UPDATE documents SET status = 'done', lease_expires = NULL WHERE id = ? AND status = 'finalizing' AND lease_owner = ?",
+        (document["id"], worker_id)
+    )
+    return cursor.rowcount == 1
+
+
+def has_unfinished_work(conn):
+    return conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM jobs WHERE status IN ('pending', 'leased')) "
+        "OR EXISTS (SELECT 1 FROM documents WHERE status IN ('open', 'finalizing'))"
+    ).fetchone()[0]
+
+
+def work(db_path, worker_id=None, lease_seconds=LEASE_SECONDS, poll_interval=2, wait=False):
+    """
+    Runs a worker: claims and runs jobs, and finalizes documents whose jobs are done.
+    Returns once the queue has no unfinished work, or keeps polling with wait=True.
+    """
+    worker_id = worker_id or get_worker_id()
+    conn = open_queue(db_path)
+    # Page timeouts are enforced with the same signal handler as the process pool workers
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, raise_budget_exceeded)
+    try:
+        while True:
+            document = claim_finalization(conn, worker_id, lease_seconds)
+            if document is not None:
+                if finalize_document(conn, document, worker_id, lease_seconds):
+                    print(f"Document {document['id']}: saved as {document['output_path']}")
+                continue
+
+            job = claim_job(conn, worker_id, lease_seconds)
+            if job is not None:
+                try:
+                    if run_job(conn, job, worker_id, lease_seconds):
+                        complete_job(conn, job["id"], worker_id)
+                except Exception as e:
+                    print(f"Job {job['id']}: failed ({type(e).__name__}: {e})", file=sys.stderr)
+                    fail_job(conn, job["id"], worker_id, f"{type(e).__name__}: {e}")
+                continue
+
+            if not wait and not has_unfinished_work(conn):
+                return
+            time.sleep(poll_interval)
+    finally:
+        conn.close()
+        # The handler belongs to the caller's process, so it is put back
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous_handler if previous_handler is not None else signal.SIG_DFL)
+
+
+def print_status(db_path):
+    conn = open_queue(db_path)
+    try:
+        for document in conn.execute("SELECT * FROM documents ORDER BY id"):
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs WHERE document_id = ? GROUP BY status", (document["id"],)).fetchall())
+            print(f"{document['id']}: {document['status']} {document['pdf_path']} -> {document['output_path']} jobs {counts}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    usage = (
+        "Usage: python pdf_job_queue.py submit <queue_db> <pdf_file> [--output=PATH] [--format=json|html|msgpack|cbor] [--pages-per-job=N] [--image-dpi=DPI] [--page-timeout=SECONDS]\n"
+        "       python pdf_job_queue.py work <queue_db> [--lease=SECONDS] [--worker-id=ID] [--wait]\n"
+        "       python pdf_job_queue.py status <queue_db>"
+    )
+    if len(sys.argv) < 3 or sys.argv[1] not in ("submit", "work", "status") or (sys.argv[1] == "submit" and len(sys.argv) < 4):
+        print(usage)
+        sys.exit(1)
+
+    command, db_path = sys.argv[1], sys.argv[2]
+    if command == "submit":
+        pdf_path = sys.argv[3]
+        output_format = "json"
+        output_path = None
+        pages_per_job = PAGES_PER_JOB
+        image_dpi = None
+        page_timeout = None
+        for arg in sys.argv[4:]:
+            if arg.startswith("--format="):
+                output_format = arg.split("=", 1)[1]
+            elif arg.startswith("--output="):
+                output_path = arg.split("=", 1)[1]
+            elif arg.startswith("--pages-per-job="):
+                pages_per_job = int(arg.split("=", 1)[1])
+            elif arg.startswith("--image-dpi="):
+                image_dpi = int(arg.split("=", 1)[1])
+            elif arg.startswith("--page-timeout="):
+                page_timeout = float(arg.split("=", 1)[1])
+        if output_format not in OUTPUT_FORMATS:
+            print(usage)
+            sys.exit(1)
+        output_path = output_path or os.path.splitext(pdf_path)[0] + f".{output_format}"
+
+        conn = open_queue(db_path)
+        try:
+            document_id = submit_document(conn, pdf_path, output_path, output_format, pages_per_job, image_dpi, page_timeout)
+        except PreflightError as e:
+            print(f"Document refused: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            conn.close()
+        print(f"Document {document_id} queued, output will be saved as {os.path.abspath(output_path)}")
+    elif command == "work":
+        lease_seconds = LEASE_SECONDS
+        worker_id = None
+        wait = False
+        for arg in sys.argv[3:]:
+            if arg.startswith("--lease="):
+                lease_seconds = float(arg.split("=", 1)[1])
+            elif arg.startswith("--worker-id="):
+                worker_id = arg.split("=", 1)[1]
+            elif arg == "--wait":
+                wait = True
+        work(db_path, worker_id, lease_seconds, wait=wait)
+    else:
+        print_status(db_path)
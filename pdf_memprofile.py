@@ -0,0 +1,128 @@
+import contextlib
+import tracemalloc
+import linecache
+import json
+import os
+
+from pdf_input import get_peak_memory_mb
+
+TOP_SITES = 10
+# Frames from the profiler itself would otherwise show up among the top sites
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def get_rss_mb():
+    """
+    Returns the current resident memory of this process in megabytes, or None if unknown.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+class MemoryProfiler:
+    """
+    Measures memory per page and per stage with tracemalloc and RSS samples.
+    Wrap each stage of the work in `with profiler.stage(name, page_number):`; for every
+    stage this records how much traced memory rose at its peak, how much it still holds
+    when it ends, and which allocation sites (file:line) account for what it holds.
+    Tracing slows conversion down considerably, so this is for diagnosis runs only.
+    """
+
+    def __init__(self, nframes=1):
+        self.nframes = nframes
+        self.records = []
+        self.sites = {}
+        self.start_rss_mb = None
+
+    def start(self):
+        tracemalloc.start(self.nframes)
+        self.start_rss_mb = get_rss_mb()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name, page_number=None):
+        if not tracemalloc.is_tracing():
+            yield
+            return
+
+        before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        current_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current_after, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            self.records.append({
+                "stage": name,
+                "page": page_number,
+                "peak_kb": round((peak - current_before) / 1024, 1),
+                "retained_kb": round((current_after - current_before) / 1024, 1),
+                "rss_mb": get_rss_mb()
+            })
+
+            stage_sites = self.sites.setdefault(name, {})
+            for stat in after.compare_to(before, "lineno"):
+                if stat.size_diff <= 0:
+                    continue
+                frame = stat.traceback[0]
+                site = f"{frame.filename}:{frame.lineno}"
+                size, count = stage_sites.get(site, (0, 0))
+                stage_sites[site] = (size + stat.size_diff, count + stat.count_diff)
+
+    def get_summary(self):
+        """
+        Returns the per-page records together with the peak of every stage across
+        pages and its top allocation sites.
+        """
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(record["stage"], {"calls": 0, "peak_kb": 0, "peak_page": None, "retained_kb": 0, "rss_peak_mb": None})
+            stage["calls"] += 1
+            stage["retained_kb"] = round(stage["retained_kb"] + record["retained_kb"], 1)
+            if record["peak_kb"] > stage["peak_kb"]:
+                stage["peak_kb"] = record["peak_kb"]
+                stage["peak_page"] = record["page"]
+            if record["rss_mb"] is not None:
+                stage["rss_peak_mb"] = max(stage["rss_peak_mb"] or 0, record["rss_mb"])
+
+        for name, stage in stages.items():
+            top_sites = sorted(self.sites.get(name, {}).items(), key=lambda item: item[1][0], reverse=True)[:TOP_SITES]
+            stage["top_sites"] = [
+                {"site": site, "size_kb": round(size / 1024, 1), "count": count}
+                for site, (size, count) in top_sites
+            ]
+
+        return {
+            "start_rss_mb": self.start_rss_mb,
+            "end_rss_mb": get_rss_mb(),
+            "peak_rss_mb": get_peak_memory_mb(),
+            "stages": stages,
+            "pages": self.records
+        }
+
+    def write_summary(self, output_path):
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.get_summary(), indent=4))
+
+
+def get_stage(profiler):
+    """
+    Returns profiler.stage, or a stand-in that measures nothing when profiling is off.
+    """
+    if profiler is None:
+        return lambda name, page_number=None: contextlib.nullcontext()
+    return profiler.stage
@@ -0,0 +1,79 @@
+import re
+import math
+
+# Runs are compared on these fields; the text is compared with digits masked so
+# that page numbers ("3", "4", ...) at the same place count as the same run
+TEMPLATE_FIELDS = ("font_size", "font_name", "font_weight", "font_style", "color", "is_superscript", "is_subscript")
+
+
+def get_template_key(word_data):
+    return (
+        re.sub(r"\d+", "#", word_data["word"]),
+        round(word_data["x"]),
+        round(word_data["y"]),
+    ) + tuple(word_data[field] for field in TEMPLATE_FIELDS)
+
+
+def detect_templates(text_data, min_ratio=0.5, min_pages=3):
+    """
+    Finds runs repeated at the same position and style on many pages (running headers,
+    footers, page numbers, watermarks). A run becomes a template when it appears on at
+    least min_ratio of the pages, and on at least min_pages pages.
+    Returns the templates: run records with an "id", in order of first appearance.
+    """
+    threshold = max(min_pages, math.ceil(min_ratio * len(text_data)))
+    page_counts = {}
+    first_runs = {}
+    for page_data in text_data:
+        for key in {get_template_key(word_data) for word_data in page_data["text"]}:
+            page_counts[key] = page_counts.get(key, 0) + 1
+        for word_data in page_data["text"]:
+            first_runs.setdefault(get_template_key(word_data), word_data)
+
+    templates = []
+    for key, word_data in first_runs.items():
+        if page_counts[key] >= threshold:
+            templates.append({"id": len(templates), **word_data})
+    return templates
+
+
+def apply_templates(text_data, templates):
+    """
+    Returns a copy of text_data where runs matching a template are removed from "text"
+    and referenced from "templates" instead: {"template": id}, plus "word" when the
+    page's text differs from the template (page numbers).
+    """
+    template_ids = {get_template_key(template): template["id"] for template in templates}
+    words_by_id = {template["id"]: template["word"] for template in templates}
+
+    result = []
+    for page_data in text_data:
+        words = []
+        references = []
+        used_ids = set()
+        for word_data in page_data["text"]:
+            template_id = template_ids.get(get_template_key(word_data))
+            if template_id is None or template_id in used_ids:
+                words.append(word_data)
+                continue
+            used_ids.add(template_id)
+            reference = {"template": template_id}
+            if word_data["word"] != words_by_id[template_id]:
+                reference["word"] = word_data["word"]
+            references.append(reference)
+        result.append({**page_data, "text": words, "templates": references})
+    return result
+
+
+def expand_templates(words, references, templates):
+    """
+    Rebuilds the full list of runs of a page from its own runs and its template references.
+    """
+    templates_by_id = {template["id"]: template for template in templates}
+    expanded = []
+    for reference in references:
+        word_data = {key: value for key, value in templates_by_id[reference["template"]].items() if key != "id"}
+        if "word" in reference:
+            word_data["word"] = reference["word"]
+        expanded.append(word_data)
+    return expanded + list(words)
@@ -0,0 +1,86 @@
+import multiprocessing as mp
+import json
+import math
+import sys
+import os
+import fitz  # PyMuPDF
+
+# Rough costs in seconds, measured on the pdfplumber + PyMuPDF extraction path:
+# a page costs a fixed overhead, plus its characters (pdfminer layout analysis),
+# plus its images (decoding and PNG encoding), plus the bytes of its content.
+PAGE_COST = 0.005
+CHAR_COST = 0.00002
+IMAGE_COST = 0.02
+BYTE_COST = 0.00000002
+# Starting a pool of preloaded forkserver workers, and the least work that makes
+# one more worker worthwhile
+POOL_STARTUP_COST = 0.5
+MIN_WORK_PER_WORKER = 0.5
+SAMPLE_PAGES = 5
+
+# Modules imported once in the forkserver, so every worker forked from it starts with them loaded
+PRELOAD_MODULES = ["fitz", "pdfplumber", "PIL.Image"]
+
+
+def probe_document(pdf_path, sample_pages=SAMPLE_PAGES):
+    """
+    Measures a few pages spread over the document with PyMuPDF, which is much faster
+    than the full extraction. Returns page count, file size and the average characters
+    and images per sampled page.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        step = max(1, page_count // sample_pages)
+        sampled = list(range(0, page_count, step))[:sample_pages]
+        chars = images = 0
+        for page_number in sampled:
+            page = doc[page_number]
+            chars += len(page.get_text())
+            images += len(page.get_image_info())
+    return {
+        "page_count": page_count,
+        "file_size": os.path.getsize(pdf_path),
+        "sampled_pages": len(sampled),
+        "chars_per_page": round(chars / len(sampled)) if sampled else 0,
+        "images_per_page": round(images / len(sampled), 2) if sampled else 0
+    }
+
+
+def plan_execution(pdf_path, max_workers=None):
+    """
+    Chooses between serial and parallel processing, and the number of workers, from the
+    page count, the file size and a quick complexity probe. Small documents run serially:
+    starting a pool costs more than their pages. Returns the plan as a dictionary.
+    """
+    plan = probe_document(pdf_path)
+    page_count = plan["page_count"]
+    bytes_per_page = plan["file_size"] / page_count if page_count else 0
+    page_cost = PAGE_COST + plan["chars_per_page"] * CHAR_COST + plan["images_per_page"] * IMAGE_COST + bytes_per_page * BYTE_COST
+    estimated = page_cost * page_count
+
+    max_workers = max_workers or mp.cpu_count()
+    workers = min(max_workers, page_count, math.floor(estimated / MIN_WORK_PER_WORKER))
+    if workers < 2 or estimated < 2 * POOL_STARTUP_COST:
+        plan.update({"mode": "serial", "workers": 1})
+    else:
+        plan.update({"mode": "parallel", "workers": workers})
+    plan["estimated_seconds"] = round(estimated, 2)
+    return plan
+
+
+def log_plan(plan, on_event=None):
+    print(f"Execution plan: {json.dumps(plan)}", file=sys.stderr)
+    if on_event:
+        on_event({"event": "plan", **plan})
+
+
+def get_mp_context():
+    """
+    Returns the forkserver start method with the heavy modules preloaded, where available
+    (not on Windows), or the platform default otherwise.
+    """
+    if "forkserver" not in mp.get_all_start_methods():
+        return mp.get_context()
+    ctx = mp.get_context("forkserver")
+    ctx.set_forkserver_preload(PRELOAD_MODULES)
+    return ctx
@@ -0,0 +1,103 @@
+import fitz  # PyMuPDF
+import json
+import sys
+
+# A preflight reads a document once with PyMuPDF, without pdfplumber's layout analysis,
+# and routes every page to the cheapest extraction that gives the same result:
+#   "text"   the page has characters and goes through the full character pipeline
+#   "image"  no characters, only images (scanned pages): words are skipped
+#   "blank"  neither
+# Files that cannot be converted (unreadable, password protected, no pages) fail here,
+# before any output is written.
+
+# Characters outside the media box are kept: pdfplumber reports them as well
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_MEDIABOX_CLIP
+
+
+class PreflightError(Exception):
+    pass
+
+
+def open_checked(pdf_path):
+    """
+    Opens a PDF with PyMuPDF, raising PreflightError if it is not a readable,
+    unlocked document with at least one page.
+    """
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        raise PreflightError(f"Cannot open {pdf_path}: {e}") from e
+    if doc.needs_pass:
+        doc.close()
+        raise PreflightError(f"{pdf_path} is password protected")
+    if len(doc) == 0:
+        doc.close()
+        raise PreflightError(f"{pdf_path} has no pages")
+    return doc
+
+
+def get_page_route(page_info):
+    if page_info["chars"]:
+        return "text"
+    return "image" if page_info["images"] else "blank"
+
+
+def preflight(pdf_path):
+    """
+    Returns the preflight of a document: page count, metadata, whether PyMuPDF had to
+    repair it, a route per page (see above) with its size, characters and images, and
+    the route of the whole document ("text" or "image" when its pages that are not blank
+    all have that route, "mixed" otherwise).
+    Raises PreflightError for documents that cannot be converted.
+    """
+    with open_checked(pdf_path) as doc:
+        pages = []
+        for page in doc:
+            try:
+                page_info = {
+                    "page": page.number,
+                    "width": round(page.rect.width, 2),
+                    "height": round(page.rect.height, 2),
+                    "chars": len(page.get_text("text", flags=TEXT_FLAGS)),
+                    "images": len(page.get_image_info())
+                }
+            except Exception as e:
+                raise PreflightError(f"Cannot read page {page.number} of {pdf_path}: {e}") from e
+            page_info["route"] = get_page_route(page_info)
+            pages.append(page_info)
+
+        routes = {page_info["route"] for page_info in pages}
+        return {
+            "page_count": len(doc),
+            "metadata": doc.metadata,
+            "repaired": doc.is_repaired,
+            "route": "image" if "text" not in routes else "mixed" if "image" in routes else "text",
+            "pages": pages
+        }
+
+
+def count_routes(report):
+    routes = [page_info["route"] for page_info in report["pages"]]
+    return {route: routes.count(route) for route in ("text", "image", "blank")}
+
+
+def log_preflight(report):
+    counts = count_routes(report)
+    print(f"Preflight: {report['route']} document, {counts['text']} text, {counts['image']} image and {counts['blank']} blank pages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python pdf_preflight.py <pdf_file> [<pdf_file> ...]")
+        sys.exit(1)
+
+    # One JSON line per document; documents that fail are reported and the exit status is 1
+    failed = False
+    for pdf_path in sys.argv[1:]:
+        try:
+            report = preflight(pdf_path)
+            print(json.dumps({"pdf": pdf_path, "route": report["route"], "page_count": report["page_count"], "repaired": report["repaired"], "routes": count_routes(report)}))
+        except PreflightError as e:
+            failed = True
+            print(json.dumps({"pdf": pdf_path, "error": str(e)}))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,67 @@
+import json
+import sys
+import time
+
+# Progress events are plain dictionaries passed to an on_event callback:
+#   {"event": "plan", "mode", "workers", "page_count", "file_size", ...}
+#     (pdf_to_json_multi_proc only, the execution plan chosen by pdf_planner)
+#   {"event": "start", "pdf", "page_count", "time"}
+#   {"event": "page", "page", "page_count", "elapsed", "total_elapsed", "chars", "runs", "images", "image_bytes"}
+#     (plus "strategy" for pages the worker pool had to degrade)
+#   {"event": "done", "page_count", "total_elapsed", "output", "bytes_written"}
+# "elapsed" is the time spent on that page, "total_elapsed" the time since the start event.
+
+
+def make_ndjson_emitter(stream=None):
+    """
+    Returns an on_event callback that writes each event as one JSON line (stderr by default).
+    """
+    def emit(event):
+        target = stream or sys.stderr
+        target.write(json.dumps(event) + "\n")
+        target.flush()
+    return emit
+
+
+def start_event(pdf_path, page_count):
+    return {"event": "start", "pdf": pdf_path.split("/")[-1], "page_count": page_count, "time": time.time()}
+
+
+def get_page_stats(text, images):
+    """
+    Returns the size of a page's content: characters, runs, images and image bytes.
+    """
+    image_bytes = 0
+    for img_data in images:
+        image_bytes += len(img_data.get("data") or img_data.get("base64") or "")
+    return {
+        "chars": sum(len(word_data["word"]) for word_data in text),
+        "runs": len(text),
+        "images": len(images),
+        "image_bytes": image_bytes
+    }
+
+
+def page_event(page_number, page_count, page_elapsed, start_time, text, images, stats=None):
+    """
+    stats (from get_page_stats) can be given instead of text and images when the page
+    itself is not at hand, e.g. when a worker process has already written it out.
+    """
+    return {
+        "event": "page",
+        "page": page_number,
+        "page_count": page_count,
+        "elapsed": round(page_elapsed, 4),
+        "total_elapsed": round(time.time() - start_time, 4),
+        **(stats or get_page_stats(text, images))
+    }
+
+
+def done_event(page_count, start_time, output_path, bytes_written):
+    return {
+        "event": "done",
+        "page_count": page_count,
+        "total_elapsed": round(time.time() - start_time, 4),
+        "output": output_path,
+        "bytes_written": bytes_written
+    }
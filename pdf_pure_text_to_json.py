@@ -1,17 +1,49 @@
 import pdfplumber
+import multiprocessing as mp
 import sys
 import time
 import json
+from pdf_compression import parse_compression, add_compression_extension, open_output
+
+def iter_page_texts(pdf_path, page_numbers=None):
+    """
+    Yields the plain text of each page lazily, in page order.
+    Pages without a text layer yield an empty string.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        if page_numbers is None:
+            page_numbers = range(len(pdf.pages))
+
+        for page_number in page_numbers:
+            page = pdf.pages[page_number]
+            yield page.extract_text() or ""
+            # Drop the parsed layout so memory stays flat on long documents
+            page.close()
+
+def extract_text_range(pdf_path, start, stop):
+    return list(iter_page_texts(pdf_path, range(start, stop)))
+
+def iter_page_texts_parallel(pdf_path, workers=None, pages_per_task=16):
+    """
+    Same as iter_page_texts, but page ranges are extracted by a process pool.
+    Pages are still yielded in order, as soon as their range is done.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+
+    ranges = [(pdf_path, start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    with mp.Pool(workers or mp.cpu_count()) as pool:
+        for texts in pool.imap(_extract_text_range_task, ranges):
+            yield from texts
+
+def _extract_text_range_task(args):
+    return extract_text_range(*args)
 
 def extract_text(pdf_path):
     """
     Extracts the plain text from a PDF file without page division.
     """
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text
+    return "".join(text + "\n" for text in iter_page_texts(pdf_path))
 
 def generate_json(pdf_path, full_text):
     result = {
@@ -20,21 +52,63 @@ def generate_json(pdf_path, full_text):
     }
     return result
 
+def write_text(page_texts, output_path, compression=None, level=None):
+    """
+    Writes pages to a plain text file as they arrive, one line break after each page.
+    """
+    with open_output(output_path, compression, level, text=True) as f:
+        for text in page_texts:
+            f.write(text)
+            f.write("\n")
+
+def write_json(pdf_path, page_texts, output_path, compression=None, level=None):
+    """
+    Writes the same document as generate_json, streaming the text page by page
+    instead of building it in memory first.
+    """
+    with open_output(output_path, compression, level, text=True) as f:
+        f.write('{\n    "pdf_name": ' + json.dumps(pdf_path.split("/")[-1]) + ',\n    "text": "')
+        for text in page_texts:
+            # json.dumps escapes the text; drop its surrounding quotes
+            f.write(json.dumps(text + "\n")[1:-1])
+        f.write('"\n}')
+
 if __name__ == "__main__":
+    usage = "Usage: python pdf_pure_text_to_json.py <pdf_file> [--format=json|text] [--workers=N] [--compress=gzip|zstd[:LEVEL]]"
     if len(sys.argv) < 2:
-        print("Usage: python pdf_pure_text_to_json.py <pdf_file>")
+        print(usage)
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
 
-    full_text = extract_text(pdf_path)
-    json_data = generate_json(pdf_path, full_text)
+    output_format = "json"
+    workers = 1
+    compression = level = None
+    for arg in sys.argv[2:]:
+        if arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+    if output_format not in ("json", "text"):
+        print(usage)
+        sys.exit(1)
+
+    if workers > 1:
+        page_texts = iter_page_texts_parallel(pdf_path, workers)
+    else:
+        page_texts = iter_page_texts(pdf_path)
 
-    with open("output.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(json_data, indent=4))
+    if output_format == "json":
+        output_path = add_compression_extension("output.json", compression)
+        write_json(pdf_path, page_texts, output_path, compression, level)
+    else:
+        output_path = add_compression_extension("output.txt", compression)
+        write_text(page_texts, output_path, compression, level)
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.json")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
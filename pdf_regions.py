@@ -0,0 +1,180 @@
+import fitz  # PyMuPDF
+import pdfplumber
+import sys
+import time
+import os
+from pdf_to_json import extract_text_from_page
+from pdf_to_json_multi_proc import extract_text_with_pymupdf
+from pdf_convert import FileSink
+from pdf_compression import parse_compression, add_compression_extension
+
+# Region of interest extraction: the text inside given rectangles of each page, for
+# consumers that need a fixed area only (an invoice header, a table).
+# A region is (x0, top, x1, bottom) in points from the top-left corner of the page,
+# the coordinates of the "x" and "y" of runs.
+# Engines:
+#   "pdfplumber"  the same runs as the full page extraction, from pdfplumber's within_bbox
+#                 (or crop). pdfplumber still interprets the whole page, so pages on which
+#                 PyMuPDF finds no text in any region are skipped without being parsed.
+#   "pymupdf"     MuPDF clips while it extracts, so only the regions are processed. Runs
+#                 are PyMuPDF spans with the same keys (as the pymupdf page strategy of
+#                 pdf_to_json_multi_proc), which is much faster but segments differently.
+
+ENGINES = ("pdfplumber", "pymupdf")
+MODES = ("text_with_format", "text")
+# PyMuPDF and pdfplumber disagree slightly on character boxes, so the probe looks a little wider
+PROBE_MARGIN = 10
+
+
+def parse_region(value):
+    """
+    Parses "x0,top,x1,bottom" into a region tuple.
+    """
+    x0, top, x1, bottom = (float(part) for part in value.split(","))
+    if x1 <= x0 or bottom <= top:
+        raise ValueError(f"Empty region: {value}")
+    return x0, top, x1, bottom
+
+
+def parse_pages(value, page_count):
+    """
+    Parses a page selection like "1,3-5" (1-based, as shown by PDF viewers) into
+    0-based page numbers. Raises ValueError for pages outside 1..page_count and for
+    reversed or malformed ranges.
+    """
+    page_numbers = []
+    for part in value.split(","):
+        first, dash, last = part.strip().partition("-")
+        if not first.isdigit() or (dash and not last.isdigit()):
+            raise ValueError(f"Not a page or page range: {part!r}")
+        first, last = int(first), int(last or first)
+        if first > last:
+            raise ValueError(f"Reversed page range: {part.strip()}")
+        if first < 1 or last > page_count:
+            raise ValueError(f"{part.strip()} is outside the document (pages 1-{page_count})")
+        page_numbers.extend(range(first - 1, last))
+    return sorted(set(page_numbers))
+
+
+def probe_regions(fitz_page, regions):
+    """
+    Returns whether PyMuPDF finds any text in or near the regions. Only meaningful when
+    both libraries measure from the same corner, i.e. on unrotated pages whose crop box
+    is their media box; on other pages it answers True.
+    """
+    if fitz_page.rotation or fitz_page.cropbox != fitz_page.mediabox:
+        return True
+    for x0, top, x1, bottom in regions:
+        clip = fitz.Rect(x0 - PROBE_MARGIN, top - PROBE_MARGIN, x1 + PROBE_MARGIN, bottom + PROBE_MARGIN)
+        if fitz_page.get_text("text", clip=clip).strip():
+            return True
+    return False
+
+
+def extract_region(page, region, mode="text_with_format", crop=False):
+    """
+    Extracts one region of a pdfplumber page. Regions reaching past the page are cut
+    to it. Characters must lie entirely inside the region, or with crop=True, only
+    touch it.
+    """
+    x0, top, x1, bottom = region
+    page_x0, page_top, page_x1, page_bottom = page.bbox
+    bbox = (max(x0, page_x0), max(top, page_top), min(x1, page_x1), min(bottom, page_bottom))
+    if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+        return [] if mode == "text_with_format" else ""
+
+    region_page = page.crop(bbox) if crop else page.within_bbox(bbox)
+    if mode == "text":
+        return region_page.extract_text()
+    return extract_text_from_page(region_page)
+
+
+def extract_regions(pdf_path, regions, mode="text_with_format", page_numbers=None, engine="pdfplumber", crop=False):
+    """
+    Yields, for every selected page in page order, {"page": n, "regions": [{"bbox": ...,
+    "text": ...}]} with one entry per region, in the order given. "text" holds runs in
+    text_with_format mode and a string in text mode.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    with fitz.open(pdf_path) as doc:
+        # pdfplumber gives the selected pages in document order
+        page_numbers = range(len(doc)) if page_numbers is None else sorted(set(page_numbers))
+        if engine == "pymupdf":
+            for page_number in page_numbers:
+                fitz_page = doc[page_number]
+                yield {"page": page_number, "regions": [
+                    {"bbox": list(region), "text": extract_text_with_pymupdf(fitz_page, fitz.Rect(region)) if mode == "text_with_format" else fitz_page.get_text("text", clip=fitz.Rect(region))}
+                    for region in regions
+                ]}
+            return
+
+        # Only the selected pages are loaded by pdfplumber (its page numbers are 1-based)
+        with pdfplumber.open(pdf_path, pages=[page_number + 1 for page_number in page_numbers]) as pdf:
+            for page_number, page in zip(page_numbers, pdf.pages):
+                if probe_regions(doc[page_number], regions):
+                    texts = [extract_region(page, region, mode, crop) for region in regions]
+                else:
+                    texts = [[] if mode == "text_with_format" else "" for region in regions]
+                # Drop the parsed layout so memory stays flat on long documents
+                page.close()
+                yield {"page": page_number, "regions": [{"bbox": list(region), "text": text} for region, text in zip(regions, texts)]}
+
+
+if __name__ == "__main__":
+    usage = "Usage: python pdf_regions.py <pdf_file> --region=X0,TOP,X1,BOTTOM [--region=...] [--pages=1,3-5] [--text] [--engine=pdfplumber|pymupdf] [--crop] [--output=PATH] [--compress=gzip|zstd[:LEVEL]]"
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+
+    start_time = time.time()
+    pdf_path = sys.argv[1]
+
+    regions = []
+    pages = None
+    mode = "text_with_format"
+    engine = "pdfplumber"
+    crop = False
+    output_path = "output.json"
+    compression = level = None
+    for arg in sys.argv[2:]:
+        if arg.startswith("--region="):
+            regions.append(parse_region(arg.split("=", 1)[1]))
+        elif arg.startswith("--pages="):
+            pages = arg.split("=", 1)[1]
+        elif arg == "--text":
+            mode = "text"
+        elif arg.startswith("--engine="):
+            engine = arg.split("=", 1)[1]
+        elif arg == "--crop":
+            crop = True
+        elif arg.startswith("--output="):
+            output_path = arg.split("=", 1)[1]
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+    if not regions or engine not in ENGINES:
+        print(usage)
+        sys.exit(1)
+    output_path = add_compression_extension(output_path, compression)
+
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    try:
+        page_numbers = parse_pages(pages, page_count) if pages else None
+    except ValueError as e:
+        print(f"Invalid --pages: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    sink = FileSink(output_path, compression=compression, level=level)
+    sink.open({"pdf_name": os.path.basename(pdf_path), "page_count": page_count, "regions": [list(region) for region in regions]})
+    for page_info in extract_regions(pdf_path, regions, mode, page_numbers, engine, crop):
+        sink.write_page(page_info["page"], page_info)
+    sink.close()
+
+    end_time = time.time()
+    execution_time = end_time - start_time
+    print(f"✅ Done processing! File saved as {output_path}")
+    print(f"Execution time: {execution_time} seconds")
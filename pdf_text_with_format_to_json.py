@@ -2,8 +2,14 @@ import pdfplumber
 import re
 import sys
 import time
-import json
+import os
 import fitz  # PyMuPDF
+from pdf_binary_output import BINARY_FORMATS
+from pdf_progress import make_ndjson_emitter, start_event, page_event, done_event
+from pdf_memprofile import MemoryProfiler
+from pdf_compact_coords import COORD_UNITS
+from pdf_compression import parse_compression, add_compression_extension
+from pdf_preflight import PreflightError, log_preflight
 
 def clean_font_name(font_name):
     font_name = font_name.split('+')[-1]
@@ -103,7 +109,7 @@ def get_page_dimensions(pdf_path):
         page = pdf.pages[0]
         return round(page.width, 2), round(page.height, 2)
 
-def generate_json(pdf_path, text_data, metadata, page_count):
+def generate_json(pdf_path, text_data, metadata, page_count, templates=None):
     pages_data = []
     for page_data in text_data:
         page_info = {
@@ -113,6 +119,8 @@ def generate_json(pdf_path, text_data, metadata, page_count):
             },
             "text": page_data['text']
         }
+        if "templates" in page_data:
+            page_info["templates"] = page_data['templates']
 
         pages_data.append(page_info)
 
@@ -122,14 +130,24 @@ def generate_json(pdf_path, text_data, metadata, page_count):
         "overall_page_count": page_count,  # Add overall page count
         "pages": pages_data
     }
+    if templates is not None:
+        result["templates"] = templates
     
     return result
 
-def process_pdf(pdf_path):
+def process_pdf(pdf_path, on_event=None):
+    """
+    on_event, if given, is called with a progress event before the first page and after each page.
+    """
+    start_time = time.time()
     text_data = []
 
     with pdfplumber.open(pdf_path) as pdf:
+        if on_event:
+            on_event(start_event(pdf_path, len(pdf.pages)))
+
         for page_number, page in enumerate(pdf.pages):
+            page_start_time = time.time()
             page_html = extract_text_from_page(page)
             page_width, page_height = get_page_dimensions(pdf_path)
 
@@ -140,25 +158,91 @@ def process_pdf(pdf_path):
                 "text": page_html
             })
 
+            if on_event:
+                on_event(page_event(page_number, len(pdf.pages), time.time() - page_start_time, start_time, page_html, []))
+
     metadata = get_pdf_metadata(pdf_path)
     page_count = len(pdf.pages)
     return text_data, metadata, page_count
 
 if __name__ == "__main__":
+    # Imported here: pdf_convert builds on the extraction functions of these scripts
+    from pdf_convert import convert, write_result, FileSink, IndexSink
+
+    usage = "Usage: python pdf_text_with_format_to_json.py <pdf_file> [--output=PATH] [--format=json|msgpack|cbor] [--index] [--templates] [--progress] [--memprofile[=PATH]] [--compact-coords[=UNITS_PER_POINT]] [--compress=gzip|zstd[:LEVEL]] [--preflight]"
     if len(sys.argv) < 2:
-        print("Usage: python pdf_text_with_format_to_json.py <pdf_file>")
+        print(usage)
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
 
-    text_data, metadata, page_count = process_pdf(pdf_path)
-    json_data = generate_json(pdf_path, text_data, metadata, page_count)
-
-    with open("output.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(json_data, indent=4))
+    output_format = "json"
+    output_path = None
+    compression = level = None
+    with_index = False
+    profile_path = None
+    options = {}
+    for arg in sys.argv[2:]:
+        if arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+        elif arg.startswith("--output="):
+            output_path = arg.split("=", 1)[1]
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+        elif arg == "--index":
+            with_index = True
+        elif arg == "--preflight":
+            options["preflight"] = True
+        elif arg == "--progress":
+            options["on_event"] = make_ndjson_emitter()
+        elif arg == "--compact-coords":
+            options["compact_coords"] = COORD_UNITS
+        elif arg.startswith("--compact-coords="):
+            options["compact_coords"] = int(arg.split("=", 1)[1])
+        elif arg == "--memprofile":
+            profile_path = "memprofile.json"
+        elif arg.startswith("--memprofile="):
+            profile_path = arg.split("=", 1)[1]
+        elif arg == "--templates":
+            # Repeated headers, footers and page numbers are stored once at document level
+            options["templates"] = True
+    if output_format != "json" and output_format not in BINARY_FORMATS:
+        print(usage)
+        sys.exit(1)
+    output_path = output_path or f"output.{output_format}"
+    index_path = os.path.splitext(output_path)[0] + ".index.json"
+    output_path = add_compression_extension(output_path, compression)
+
+    if profile_path:
+        options["profiler"] = MemoryProfiler()
+        options["profiler"].start()
+
+    try:
+        result = convert(pdf_path, "text_with_format", options)
+    except PreflightError as e:
+        print(f"Preflight failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if result.preflight:
+        log_preflight(result.preflight)
+    page_count = result.header["overall_page_count"]
+    # Compact coordinates go with compact JSON, indentation would outweigh what they save
+    sinks = [FileSink(output_path, output_format, indent=None if options.get("compact_coords") else 4, compression=compression, level=level)]
+    if with_index:
+        sinks.append(IndexSink(index_path))
+    write_result(result, *sinks)
+    if with_index:
+        print(f"Word index saved as {sinks[1].index_path}")
+
+    if profile_path:
+        options["profiler"].stop()
+        options["profiler"].write_summary(profile_path)
+        print(f"Memory profile saved as {profile_path}")
+
+    if "on_event" in options:
+        options["on_event"](done_event(page_count, start_time, output_path, os.path.getsize(output_path)))
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.json")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
@@ -1,7 +1,8 @@
 import pdfplumber
 import sys
 import time
-import json
+from pdf_compression import parse_compression, add_compression_extension
+from pdf_preflight import PreflightError, log_preflight
 
 def extract_text_from_page(page):
     """
@@ -37,33 +38,51 @@ def process_pdf(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
         for page_number, page in enumerate(pdf.pages):
             page_text = extract_text_from_page(page)
-            page_width, page_height = get_page_dimensions(pdf_path)
 
             text_data.append({
                 "page": page_number,
-                "width": page_width,
-                "height": page_height,
+                "width": round(page.width, 2),
+                "height": round(page.height, 2),
                 "text": page_text
             })
+            # Drop the parsed layout so memory stays flat on long documents
+            page.close()
 
     page_count = len(pdf.pages)
     return text_data, page_count
 
 if __name__ == "__main__":
+    from pdf_convert import convert, write_result, FileSink
+
     if len(sys.argv) < 2:
-        print("Usage: python pdf_text_without_format_to_json.py <pdf_file>")
+        print("Usage: python pdf_text_without_format_to_json.py <pdf_file> [--output=PATH] [--compress=gzip|zstd[:LEVEL]] [--preflight]")
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
 
-    text_data, page_count = process_pdf(pdf_path)
-    json_data = generate_json(pdf_path, text_data, page_count)
+    output_path = "output.json"
+    compression = level = None
+    options = {}
+    for arg in sys.argv[2:]:
+        if arg.startswith("--output="):
+            output_path = arg.split("=", 1)[1]
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+        elif arg == "--preflight":
+            options["preflight"] = True
+    output_path = add_compression_extension(output_path, compression)
 
-    with open("output.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(json_data, indent=4))
+    try:
+        result = convert(pdf_path, "text", options)
+    except PreflightError as e:
+        print(f"Preflight failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if result.preflight:
+        log_preflight(result.preflight)
+    write_result(result, FileSink(output_path, compression=compression, level=level))
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.json")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
@@ -5,10 +5,15 @@ from pymongo import MongoClient
 from io import BytesIO
 import time
 import os
+from pdf_input import STREAM_FORMATS, BATCH_SIZE, open_pdf_input, ingest_document_stream, report_input_memory, get_peak_memory_mb
+from pdf_compression import parse_compression, compress_payload
 
-def extract_text_from_stream(pdf_bytes, file_name_with_ext):
+def extract_text_from_stream(pdf_stream, file_name_with_ext):
+    """
+    Extracts the text of a PDF given as bytes or as a file-like object (e.g. a memory map).
+    """
     pages = []
-    pdf_buffer = BytesIO(pdf_bytes)
+    pdf_buffer = BytesIO(pdf_stream) if isinstance(pdf_stream, (bytes, bytearray)) else pdf_stream
 
     with pdfplumber.open(pdf_buffer) as pdf:
         for page in pdf.pages:
@@ -24,32 +29,63 @@ def extract_text_from_stream(pdf_bytes, file_name_with_ext):
         "p": pages
     }
 
-def save_to_mongodb(data, user_id, mongo_uri, db_name, collection_name):
+def save_to_mongodb(data, user_id, mongo_uri, db_name, collection_name, compression=None, level=None):
+    """
+    With compression ("gzip" or "zstd"), the pages ("p") are stored as one compressed
+    binary payload "p_z"; pdf_compression.expand_payload restores them.
+    """
     client = MongoClient(mongo_uri)
     try:
         db = client[db_name]
         collection = db[collection_name]
         data["userId"] = user_id
+        if compression:
+            data = compress_payload(data, "p", compression, level)
         result = collection.insert_one(data)
         print(f"Data saved to MongoDB with _id: {result.inserted_id}")
     finally:
         client.close()
         print("MongoDB connection closed")
 
+def convert_stream_document(header, pdf_path, pdf_map, compression=None, level=None):
+    """
+    Extracts the text of one document of a multi-document stream into the document to store.
+    """
+    data = extract_text_from_stream(pdf_map, header["file_name"])
+    data["userId"] = header["userId"]
+    return compress_payload(data, "p", compression, level) if compression else data
+
 if __name__ == "__main__":
-    if len(sys.argv) < 6:
-        print("Usage: cat file.pdf | python script.py <userId> <mongo_uri> <db_name> <collection_name> <file_name>")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    stream_format = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--stream=")), None)
+    if len(args) < (3 if stream_format else 5) or (stream_format and stream_format not in STREAM_FORMATS):
+        print("Usage: cat file.pdf | python script.py <userId> <mongo_uri> <db_name> <collection_name> <file_name> [--input=<path|fd:N>] [--compress=gzip|zstd[:LEVEL]]\n"
+              "       cat documents | python script.py <mongo_uri> <db_name> <collection_name> --stream=framed|tar [--batch-size=N] [--input=<path|fd:N>] [--compress=gzip|zstd[:LEVEL]]")
         sys.exit(1)
 
-    user_id = sys.argv[1]
-    mongo_uri = sys.argv[2]
-    db_name = sys.argv[3]
-    collection_name = sys.argv[4]
-    file_name = sys.argv[5]
-
-    pdf_bytes = sys.stdin.buffer.read()
+    input_source = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--input=")), "-")
+    compress = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--compress=")), None)
+    compression, level = parse_compression(compress) if compress else (None, None)
 
     start = time.time()
-    data = extract_text_from_stream(pdf_bytes, file_name)
-    save_to_mongodb(data, user_id, mongo_uri, db_name, collection_name)
+    if stream_format:
+        # Many documents, each with its own userId and file name, through one process and connection
+        mongo_uri, db_name, collection_name = args[:3]
+        batch_size = int(next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--batch-size=")), BATCH_SIZE))
+        saved, failed = ingest_document_stream(input_source, stream_format, lambda header, pdf_path, pdf_map: convert_stream_document(header, pdf_path, pdf_map, compression, level),
+                                               mongo_uri, db_name, collection_name, "b", batch_size)
+        print(f"{saved} documents saved, {failed} failed, peak memory: {get_peak_memory_mb()} MB")
+        print(f"Done in {round(time.time() - start, 2)} seconds")
+        sys.exit(1 if failed else 0)
+
+    user_id = args[0]
+    mongo_uri = args[1]
+    db_name = args[2]
+    collection_name = args[3]
+    file_name = args[4]
+    # stdin is spooled to a temporary file and memory-mapped rather than read into memory
+    with open_pdf_input(input_source) as (pdf_path, pdf_map):
+        data = extract_text_from_stream(pdf_map, file_name)
+        report_input_memory(pdf_map)
+    save_to_mongodb(data, user_id, mongo_uri, db_name, collection_name, compression, level)
     print(f"Done in {round(time.time() - start, 2)} seconds")
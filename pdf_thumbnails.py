@@ -0,0 +1,109 @@
+import fitz  # PyMuPDF
+import multiprocessing as mp
+import hashlib
+import base64
+import os
+import sys
+import time
+
+THUMBNAIL_SIZE = 200
+
+
+def get_file_hash(pdf_path):
+    """
+    Returns a short content hash of the PDF, used to key the thumbnail cache.
+    """
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def get_thumbnail_name(file_hash, page_number, max_size):
+    return f"thumb-{file_hash}-{page_number + 1:05d}-{max_size}.png"
+
+
+def render_thumbnail(page, max_size=THUMBNAIL_SIZE):
+    """
+    Renders a page so that its longer side is max_size pixels and returns PNG bytes.
+    """
+    zoom = max_size / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes("png")
+
+
+def render_thumbnail_range(pdf_path, page_numbers, output_dir, max_size, file_hash):
+    """
+    Renders the thumbnails of a group of pages, skipping pages already in the cache.
+    """
+    doc = fitz.open(pdf_path)
+    for page_number in page_numbers:
+        thumbnail_path = os.path.join(output_dir, get_thumbnail_name(file_hash, page_number, max_size))
+        if os.path.exists(thumbnail_path):
+            continue
+
+        # Write under a temporary name so a concurrent reader never sees a partial file
+        temp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(render_thumbnail(doc[page_number], max_size))
+        os.replace(temp_path, thumbnail_path)
+    doc.close()
+
+
+def render_thumbnails(pdf_path, output_dir, max_size=THUMBNAIL_SIZE, workers=None):
+    """
+    Renders a thumbnail for every page across a process pool and returns the
+    thumbnail paths in page order. Thumbnails are cached in output_dir by PDF
+    content hash, page and size, so repeated runs only render missing pages.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    file_hash = get_file_hash(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+
+    thumbnail_paths = [os.path.join(output_dir, get_thumbnail_name(file_hash, page_number, max_size)) for page_number in range(page_count)]
+    missing_pages = [page_number for page_number, path in enumerate(thumbnail_paths) if not os.path.exists(path)]
+    if not missing_pages:
+        return thumbnail_paths
+
+    workers = min(workers or mp.cpu_count(), len(missing_pages))
+    if workers == 1:
+        render_thumbnail_range(pdf_path, missing_pages, output_dir, max_size, file_hash)
+    else:
+        # Interleave pages so every worker gets a similar mix of light and heavy pages
+        page_groups = [missing_pages[start::workers] for start in range(workers)]
+        with mp.Pool(workers) as pool:
+            pool.starmap(render_thumbnail_range, [(pdf_path, group, output_dir, max_size, file_hash) for group in page_groups])
+
+    return thumbnail_paths
+
+
+def load_thumbnails(thumbnail_paths, raw=False):
+    """
+    Reads rendered thumbnails for embedding: Base64 strings, or PNG bytes when raw is set.
+    """
+    thumbnails = []
+    for thumbnail_path in thumbnail_paths:
+        with open(thumbnail_path, "rb") as f:
+            data = f.read()
+        thumbnails.append(data if raw else base64.b64encode(data).decode("utf-8"))
+    return thumbnails
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python pdf_thumbnails.py <pdf_file> [output_dir] [max_size]")
+        sys.exit(1)
+
+    start_time = time.time()
+    pdf_path = sys.argv[1]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else "thumbnails"
+    max_size = int(sys.argv[3]) if len(sys.argv) > 3 else THUMBNAIL_SIZE
+
+    thumbnail_paths = render_thumbnails(pdf_path, output_dir, max_size)
+
+    end_time = time.time()
+    execution_time = end_time - start_time
+    print(f"✅ Done processing! {len(thumbnail_paths)} thumbnails saved to {output_dir}/")
+    print(f"Execution time: {execution_time} seconds")
@@ -1,57 +1,24 @@
 import fitz  # PyMuPDF
-from PIL import Image
-from io import BytesIO
 import base64
 import pdfplumber
 import sys
 import time
 import re
-
-# Function to extract an image from PDF and convert it to Base64 format
-def get_image_base64(pdf_path, page_number, img_index):
-    """
-    Retrieves an image from the PDF on the specified page and converts it to Base64 format.
-    """
-    doc = fitz.open(pdf_path)
-
-    # Extract images from each page
-    img_list = doc.get_page_images(page_number)
-    img = img_list[img_index]
-    base = fitz.Pixmap(doc, img[0])
-
-    if img[1]:  # If there is a mask
-        mask = fitz.Pixmap(doc, img[1])
-        pix = fitz.Pixmap(base, mask)
-    else:
-        pix = base
-
-    # Convert Pixmap to image
-    image_data = BytesIO(pix.tobytes("png"))
-    img_pil = Image.open(image_data)
-
-    # Convert image to Base64
-    buffered = BytesIO()
-    img_pil.save(buffered, format="PNG")
-    img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
-    return img_base64
-
-# Function to get the coordinates of an image
-def get_image_coordinates(pdf_path, page_number, img_index):
-    """
-    Retrieves the coordinates of an image on the specified page.
-    """
-    with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[page_number]
-        images = page.images
-        img = images[img_index]
-        
-        # Image coordinates
-        pdf_x0, pdf_y0, pdf_x1, pdf_y1 = img["x0"], img["top"], img["x1"], img["bottom"]
-        img_width = abs(pdf_x1 - pdf_x0)
-        img_height = abs(pdf_y1 - pdf_y0)
-
-        return round(pdf_x0, 2), round(pdf_y0, 2), round(img_width, 2), round(img_height, 2)
+import zlib
+import json
+import os
+import html
+import shutil
+import multiprocessing as mp
+from pdf_thumbnails import THUMBNAIL_SIZE, render_thumbnails
+from pdf_page_templates import detect_templates, apply_templates
+from pdf_images import ImageEncoder, get_image_position
+from pdf_progress import make_ndjson_emitter, start_event, page_event, done_event
+from pdf_binary_output import read_binary
+from pdf_compact_coords import expand_page, get_coord_units
+from pdf_compression import parse_compression, add_compression_extension, strip_compression_extension, open_output, open_input
+from pdf_fonts import FONT_CACHE_DIR, FONT_EXTENSIONS, extract_fonts, get_font_data_uri
+from pdf_preflight import TEXT_FLAGS, PreflightError, preflight, log_preflight
 
 def clean_font_name(font_name):
     font_name = font_name.split('+')[-1]
@@ -60,6 +27,12 @@ def clean_font_name(font_name):
     font_name = re.sub(r'-$', '', font_name)
     return font_name.strip()
 
+# Family, weight and style of the runs written with a PDF font
+def get_font_style(font_name):
+    font_weight = "bold" if "Bold" in font_name else "normal"
+    font_style = "italic" if "Italic" in font_name or "Oblique" in font_name else "normal"
+    return clean_font_name(font_name), font_weight, font_style
+
 def append_word(words_data, word, font_size, font_name, font_weight, font_style, color_str, x, y, is_superscript=False, is_subscript=False):
     words_data.append({
         "word": word,
@@ -91,9 +64,7 @@ def extract_text_from_page(page):
 
         color_str = f"rgb({color[0] * 255}, {color[1] * 255}, {color[2] * 255})" if len(color) == 3 else f"rgb({color[0] * 255}, {color[0] * 255}, {color[0] * 255})"
         
-        normalized_font_name = clean_font_name(font_name)
-        font_weight = "bold" if "Bold" in font_name else "normal"
-        font_style = "italic" if "Italic" in font_name or "Oblique" in font_name else "normal"
+        normalized_font_name, font_weight, font_style = get_font_style(font_name)
 
         if not word or (prev_font_size != font_size or prev_font_name != normalized_font_name or prev_font_weight != font_weight or prev_font_style != font_style):
             if word:
@@ -147,12 +118,86 @@ def get_page_dimensions(pdf_path):
         page = pdf.pages[0]  # Get the dimensions of the first page (if all pages are the same)
         return round(page.width, 2), round(page.height, 2)
 
-def generate_html(pdf_path, images_data, text_data):
-    # Get page dimensions
-    page_width, page_height = get_page_dimensions(pdf_path)
-    
-    # HTML template
-    html_template = """<!DOCTYPE html>
+# Groups embedded fonts by the family, weight and style of their runs. Subsets of one font
+# are separate programs, so a run lists all of them and the browser takes each glyph
+# from the first that has it, falling back to the font name.
+def get_font_stacks(fonts):
+    font_stacks = {}
+    for font in fonts or []:
+        families = font_stacks.setdefault(get_font_style(font["name"]), [])
+        if font["family"] not in families:
+            families.append(font["family"])
+    return font_stacks
+
+def get_font_family(word_data, font_stacks=None):
+    families = (font_stacks or {}).get((word_data["font_name"], word_data["font_weight"], word_data["font_style"]), [])
+    return ", ".join(families + [word_data["font_name"]])
+
+# Builds one @font-face rule per font program, embedded as a data URI unless font_urls
+# gives the URL of its asset
+def generate_font_faces(fonts, font_urls=None):
+    styles = ""
+    families = set()
+    for font in fonts or []:
+        if font["family"] in families:
+            continue
+        families.add(font["family"])
+        _, font_weight, font_style = get_font_style(font["name"])
+        src = font_urls[font["family"]] if font_urls else get_font_data_uri(font)
+        styles += (
+            f'@font-face {{ font-family:{font["family"]}; src:url("{src}") format("{font["format"]}"); '
+            f'font-weight:{font_weight}; font-style:{font_style}; }}\n'
+        )
+    return styles
+
+# Builds the inner markup of one page: its images followed by its text spans
+def generate_page_body(page_data, images_data, lazy_images=False, templates=None, font_stacks=None):
+    page_number = page_data['page']
+    img_attributes = ' loading="lazy" decoding="async"' if lazy_images else ''
+    page_html = ""
+
+    # Add images for this page
+    for img_data in [img for img in images_data if img['page'] == page_number]:
+        # Images written as separate assets carry their relative URL in "src"
+        img_src = img_data.get('src') or f"data:image/png;base64,{img_data['base64']}"
+        pdf_x0, pdf_y0, img_width, img_height = img_data['coordinates'].values()
+        page_html += f'<img src="{img_src}"{img_attributes} style="width:{img_width}px; height:{img_height}px; left:{pdf_x0}px; top:{pdf_y0}px;" />\n'
+
+    # Add text for this page
+    for word_data in page_data['text']:
+        page_html += (
+            f'<span style="font-size:{word_data["font_size"]}px; font-family:{get_font_family(word_data, font_stacks)}; '
+            f'font-weight:{word_data["font_weight"]}; font-style:{word_data["font_style"]}; color:{word_data["color"]}; '
+            f'left:{word_data["x"]}px; top:{word_data["y"]}px;">{word_data["word"]}</span>\n'
+        )
+
+    # Add the invisible text layer of a rasterized page, one transparent span per region
+    for region in page_data.get('text_layer', []):
+        page_html += (
+            f'<span style="color:transparent; font-size:{region["font_size"]}px; width:{region["width"]}px; '
+            f'left:{region["x"]}px; top:{region["y"]}px;">{html.escape(region["text"])}</span>\n'
+        )
+
+    # Add repeated runs (headers, footers, page numbers), styled by their shared template class
+    template_words = {template["id"]: template["word"] for template in templates or []}
+    for reference in page_data.get('templates', []):
+        word = reference.get("word", template_words[reference["template"]])
+        page_html += f'<span class="tpl-{reference["template"]}">{word}</span>\n'
+
+    return page_html
+
+# Builds one CSS rule per template so repeated runs share their markup
+def generate_template_styles(templates, font_stacks=None):
+    styles = ""
+    for template in templates or []:
+        styles += (
+            f'.tpl-{template["id"]} {{ font-size:{template["font_size"]}px; font-family:{get_font_family(template, font_stacks)}; '
+            f'font-weight:{template["font_weight"]}; font-style:{template["font_style"]}; color:{template["color"]}; '
+            f'left:{template["x"]}px; top:{template["y"]}px; }}\n'
+        )
+    return styles
+
+HTML_TEMPLATE = """<!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
@@ -160,6 +205,7 @@ def generate_html(pdf_path, images_data, text_data):
             .page {{ position: relative; width: {page_width}px; height: {page_height}px; border: 1px solid #ddd; margin-bottom: 20px; }}
             img {{ position: absolute; }}
             span {{ position: absolute; white-space: pre; }}
+            {template_styles}
         </style>
     </head>
     <body>
@@ -167,78 +213,519 @@ def generate_html(pdf_path, images_data, text_data):
     </body>
     </html>"""
 
+# Records how a page was produced ("text" or "raster"), for pages processed with a budget
+def get_strategy_attribute(page_data):
+    return f' data-strategy="{page_data["strategy"]}"' if "strategy" in page_data else ""
+
+def generate_page_div(page_data, images_data, templates=None, font_stacks=None):
+    page_html = f'<div class="page"{get_strategy_attribute(page_data)} style="width:{page_data["width"]}px; height:{page_data["height"]}px;">\n'
+    page_html += generate_page_body(page_data, images_data, templates=templates, font_stacks=font_stacks)
+    page_html += "</div>\n"
+    return page_html
+
+def generate_html(pdf_path, images_data, text_data, templates=None, fonts=None):
+    # Get page dimensions (documents loaded from a JSON output have no PDF at hand)
+    if pdf_path is None:
+        page_width, page_height = (text_data[0]["width"], text_data[0]["height"]) if text_data else (0, 0)
+    else:
+        page_width, page_height = get_page_dimensions(pdf_path)
+
+    font_stacks = get_font_stacks(fonts)
     html_content = ""
     for page_data in text_data:
-        page_number = page_data['page']
-        page_html = f'<div class="page" style="width:{page_width}px; height:{page_height}px;">\n'
+        html_content += generate_page_div(page_data, images_data, templates, font_stacks)
 
-        # Add images for this page
-        for img_data in [img for img in images_data if img['page'] == page_number]:
-            img_base64 = img_data['base64']
-            pdf_x0, pdf_y0, img_width, img_height = img_data['coordinates'].values()
-            page_html += f'<img src="data:image/png;base64,{img_base64}" style="width:{img_width}px; height:{img_height}px; left:{pdf_x0}px; top:{pdf_y0}px;" />\n'
+    template_styles = generate_font_faces(fonts) + generate_template_styles(templates, font_stacks)
+    return HTML_TEMPLATE.format(page_width=page_width, page_height=page_height, template_styles=template_styles, content=html_content)
 
-        # Add text for this page
-        for word_data in page_data['text']:
-            page_html += (
-                f'<span style="font-size:{word_data["font_size"]}px; font-family:{word_data["font_name"]}; '
-                f'font-weight:{word_data["font_weight"]}; font-style:{word_data["font_style"]}; color:{word_data["color"]}; '
-                f'left:{word_data["x"]}px; top:{word_data["y"]}px;">{word_data["word"]}</span>\n'
-            )
+def load_json_document(json_path):
+    """
+    Reads a document written by pdf_to_json (JSON, msgpack or cbor, with or without
+    compact coordinates) into the images_data and text_data used by the HTML writers.
+    Returns (images_data, text_data, templates).
+    """
+    extension = os.path.splitext(strip_compression_extension(json_path))[1].lower()
+    if extension == ".json":
+        with open_input(json_path) as f:
+            json_data = json.load(f)
+    else:
+        json_data = read_binary(json_path, extension[1:])
+    units = get_coord_units(json_data)
 
-        page_html += "</div>\n"
-        html_content += page_html
+    images_data = []
+    text_data = []
+    for page_number, page_info in enumerate(json_data["pages"]):
+        if units:
+            page_info = expand_page(page_info, units)
+        for img_data in page_info.get("images", []):
+            img_base64 = img_data.get("base64") or base64.b64encode(img_data["data"]).decode("utf-8")
+            images_data.append({"page": page_number, "base64": img_base64, "coordinates": img_data["position"]})
+        text_data.append({
+            "page": page_number,
+            "width": page_info["size"]["width"],
+            "height": page_info["size"]["height"],
+            "text": page_info["text"],
+            **({"templates": page_info["templates"]} if "templates" in page_info else {})
+        })
+    return images_data, text_data, json_data.get("templates")
+
+# Inflates a page body when its placeholder comes near the viewport
+LAZY_LOADER_SCRIPT = """
+    const pageData = JSON.parse(document.getElementById("page-data").textContent);
+    async function inflatePage(encoded) {
+        const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+        return await new Response(stream).text();
+    }
+    const observer = new IntersectionObserver(entries => {
+        for (const entry of entries) {
+            if (!entry.isIntersecting) continue;
+            const page = entry.target;
+            observer.unobserve(page);
+            inflatePage(pageData[page.dataset.page]).then(html => { page.innerHTML = html; });
+        }
+    }, { rootMargin: "200% 0px" });
+    document.querySelectorAll(".page").forEach(page => observer.observe(page));
+"""
+
+def generate_lazy_html(images_data, text_data, templates=None, fonts=None):
+    """
+    Generates HTML in which every page is an empty placeholder with its own real size.
+    Page bodies are stored deflate-compressed in an embedded payload and inflated by
+    the browser only when the page scrolls into view, so opening a long document
+    does not parse and lay out every page upfront.
+    """
+    html_template = """<!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            .page {{ position: relative; border: 1px solid #ddd; margin-bottom: 20px; content-visibility: auto; }}
+            img {{ position: absolute; }}
+            span {{ position: absolute; white-space: pre; }}
+            {template_styles}
+        </style>
+    </head>
+    <body>
+    {content}
+    <script id="page-data" type="application/json">{page_data}</script>
+    <script>{script}</script>
+    </body>
+    </html>"""
 
-    return html_template.format(page_width=page_width, page_height=page_height, content=html_content)
+    font_stacks = get_font_stacks(fonts)
+    html_content = ""
+    page_payload = []
+    for index, page_data in enumerate(text_data):
+        width, height = page_data['width'], page_data['height']
+        html_content += (
+            f'<div class="page" data-page="{index}"{get_strategy_attribute(page_data)} '
+            f'style="width:{width}px; height:{height}px; contain-intrinsic-size:{width}px {height}px;"></div>\n'
+        )
+        page_body = generate_page_body(page_data, images_data, lazy_images=True, templates=templates, font_stacks=font_stacks)
+        page_payload.append(base64.b64encode(zlib.compress(page_body.encode("utf-8"))).decode("ascii"))
+
+    template_styles = generate_font_faces(fonts) + generate_template_styles(templates, font_stacks)
+    return html_template.format(template_styles=template_styles, content=html_content, page_data=json.dumps(page_payload), script=LAZY_LOADER_SCRIPT)
+
+# Viewer for split output: fetches manifest.json and loads page files as they scroll into view
+SPLIT_VIEWER_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <style>
+        .page { position: relative; border: 1px solid #ddd; margin-bottom: 20px; content-visibility: auto; }
+        .file > .page { border: none; margin: 0; }
+        img { position: absolute; }
+        span { position: absolute; white-space: pre; }
+    </style>
+</head>
+<body>
+<script>
+    fetch("manifest.json").then(response => response.json()).then(manifest => {
+        const observer = new IntersectionObserver(entries => {
+            for (const entry of entries) {
+                if (!entry.isIntersecting) continue;
+                const file = entry.target;
+                observer.unobserve(file);
+                fetch(file.dataset.src).then(response => response.text()).then(html => { file.innerHTML = html; });
+            }
+        }, { rootMargin: "200% 0px" });
+        for (const entry of manifest.files) {
+            const file = document.createElement("div");
+            file.className = "file";
+            file.dataset.src = entry.file;
+            for (const page of entry.pages) {
+                const placeholder = document.createElement("div");
+                placeholder.className = "page";
+                placeholder.style.width = page.width + "px";
+                placeholder.style.height = page.height + "px";
+                if (page.thumbnail) placeholder.style.background = `url("${page.thumbnail}") center / contain no-repeat`;
+                file.appendChild(placeholder);
+            }
+            document.body.appendChild(file);
+            observer.observe(file);
+        }
+    });
+</script>
+</body>
+</html>
+"""
+
+def write_split_file(pdf_path, page_numbers, output_dir, image_dpi=None, font_stacks=None, max_chars=None, text_layer=True, on_event=None):
+    """
+    Extracts a group of pages and writes them as one HTML fragment, with images saved
+    as separate PNG assets. Returns the manifest entry of the written file.
+    """
+    images_data, text_data = process_pdf(pdf_path, page_numbers, raw_images=True, image_dpi=image_dpi, on_event=on_event, max_chars=max_chars, text_layer=text_layer)
+
+    assets = []
+    for img_data in images_data:
+        img_number = sum(1 for asset_img in images_data if asset_img['page'] == img_data['page'] and 'src' in asset_img) + 1
+        asset_name = f"assets/page-{img_data['page'] + 1:05d}-{img_number}.png"
+        with open(os.path.join(output_dir, asset_name), "wb") as f:
+            f.write(img_data['data'])
+        img_data['src'] = asset_name
+        assets.append({"file": asset_name, "bytes": len(img_data['data'])})
+
+    fragment = ""
+    for page_data in text_data:
+        fragment += f'<div class="page" data-page="{page_data["page"]}"{get_strategy_attribute(page_data)} style="width:{page_data["width"]}px; height:{page_data["height"]}px;">\n'
+        fragment += generate_page_body(page_data, images_data, lazy_images=True, font_stacks=font_stacks)
+        fragment += "</div>\n"
+
+    first_page, last_page = page_numbers[0] + 1, page_numbers[-1] + 1
+    file_name = f"page-{first_page:05d}.html" if first_page == last_page else f"pages-{first_page:05d}-{last_page:05d}.html"
+    fragment_bytes = fragment.encode("utf-8")
+    with open(os.path.join(output_dir, file_name), "wb") as f:
+        f.write(fragment_bytes)
+
+    return {
+        "file": file_name,
+        "bytes": len(fragment_bytes),
+        "pages": [{"page": page_data["page"], "width": page_data["width"], "height": page_data["height"]} for page_data in text_data],
+        "assets": assets
+    }
+
+def write_split_html(pdf_path, output_dir, pages_per_file=1, workers=None, thumbnail_size=None, image_dpi=None, on_event=None, font_cache_dir=None, max_chars=None, text_layer=True):
+    """
+    Writes the document as one HTML fragment per group of pages_per_file pages, plus
+    manifest.json and an index.html viewer. Groups are written by a process pool in
+    whatever order workers finish; the manifest lists them in page order.
+    With thumbnail_size, page thumbnails are rendered into assets/ and listed in the manifest.
+    With font_cache_dir, embedded fonts are written into assets/ and declared in fonts.css.
+    max_chars and text_layer are passed on to process_pdf.
+    """
+    os.makedirs(os.path.join(output_dir, "assets"), exist_ok=True)
+
+    fonts = extract_fonts(pdf_path, font_cache_dir) if font_cache_dir else []
+    font_urls = {}
+    for font in fonts:
+        font_urls[font["family"]] = f"assets/{font['family']}.{FONT_EXTENSIONS[font['format']]}"
+        shutil.copyfile(font["path"], os.path.join(output_dir, font_urls[font["family"]]))
+    font_stacks = get_font_stacks(fonts)
+
+    start_time = time.time()
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    if on_event:
+        on_event(start_event(pdf_path, page_count))
+
+    page_groups = [list(range(start, min(start + pages_per_file, page_count))) for start in range(0, page_count, pages_per_file)]
+    files = []
+    with mp.Pool(workers or mp.cpu_count()) as pool:
+        for entry, events in pool.imap_unordered(_write_split_file_task, [(pdf_path, group, output_dir, image_dpi, font_stacks, max_chars, text_layer) for group in page_groups]):
+            files.append(entry)
+            # Page events are collected in the workers and relayed once their file is written
+            for event in events if on_event else []:
+                event["total_elapsed"] = round(time.time() - start_time, 4)
+                on_event(event)
+    files.sort(key=lambda entry: entry["pages"][0]["page"])
+
+    if thumbnail_size:
+        thumbnail_paths = render_thumbnails(pdf_path, os.path.join(output_dir, "assets"), thumbnail_size, workers)
+        for entry in files:
+            for page_info in entry["pages"]:
+                page_info["thumbnail"] = "assets/" + os.path.basename(thumbnail_paths[page_info["page"]])
+
+    manifest = {
+        "pdf_name": pdf_path.split("/")[-1],
+        "page_count": page_count,
+        "pages_per_file": pages_per_file,
+        "files": files
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(manifest, indent=4))
+    viewer_html = SPLIT_VIEWER_HTML
+    if fonts:
+        with open(os.path.join(output_dir, "fonts.css"), "w", encoding="utf-8") as f:
+            f.write(generate_font_faces(fonts, font_urls))
+        viewer_html = viewer_html.replace("</head>", '    <link rel="stylesheet" href="fonts.css">\n</head>')
+    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(viewer_html)
+
+    return manifest
+
+def _write_split_file_task(args):
+    events = []
+    entry = write_split_file(*args, on_event=events.append)
+    return entry, events
+
+# Pages with more characters than the budget would become thousands of positioned spans,
+# slow to write and to display; they are rendered as an image at RASTER_DPI instead
+MAX_PAGE_CHARS = 10000
+RASTER_DPI = 150
+# The text layer of a rasterized page merges its text blocks into the cells of a grid
+# this many columns by rows, so dense pages get at most that many text nodes
+TEXT_LAYER_COLUMNS = 4
+TEXT_LAYER_ROWS = 40
+
+def get_page_strategy(fitz_page, max_chars=None, page_check=None):
+    if not max_chars:
+        return "text"
+    # Counted with PyMuPDF, so over-complex pages are never parsed by pdfplumber
+    char_count = page_check["chars"] if page_check else len(fitz_page.get_text("text", flags=TEXT_FLAGS))
+    return "raster" if char_count > max_chars else "text"
+
+def rasterize_page(fitz_page, dpi=RASTER_DPI):
+    return fitz_page.get_pixmap(dpi=dpi, alpha=False).tobytes("png")
+
+def get_text_layer(fitz_page):
+    """
+    Returns the text of a page as one record per grid cell holding text (see
+    TEXT_LAYER_COLUMNS), with the lines of the blocks starting in the cell, their
+    bounding box and their average line height. Too coarse to place glyphs, but enough
+    to select and search the text of a rasterized page.
+    """
+    cell_width = fitz_page.rect.width / TEXT_LAYER_COLUMNS
+    cell_height = fitz_page.rect.height / TEXT_LAYER_ROWS
+    cells = {}
+    for block in fitz_page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        x0, y0 = block["bbox"][:2]
+        cell = (min(max(int(y0 // cell_height), 0), TEXT_LAYER_ROWS - 1), min(max(int(x0 // cell_width), 0), TEXT_LAYER_COLUMNS - 1))
+        for line in block.get("lines", []):
+            text = "".join(span["text"] for span in line["spans"])
+            if text.strip():
+                cells.setdefault(cell, []).append((text, line["bbox"]))
+
+    regions = []
+    for cell in sorted(cells):
+        lines = cells[cell]
+        x0 = min(bbox[0] for _, bbox in lines)
+        y0 = min(bbox[1] for _, bbox in lines)
+        x1 = max(bbox[2] for _, bbox in lines)
+        y1 = max(bbox[3] for _, bbox in lines)
+        regions.append({
+            "text": "\n".join(text for text, _ in lines),
+            "x": round(x0, 2), "y": round(y0, 2), "width": round(x1 - x0, 2), "height": round(y1 - y0, 2),
+            "font_size": round(sum(bbox[3] - bbox[1] for _, bbox in lines) / len(lines), 2)
+        })
+    return regions
+
+def process_page(doc, page, strategy="text", submitted_images=(), raw_images=False, image_dpi=None, extract_chars=True, text_layer=True):
+    """
+    Builds one page from its open PyMuPDF document and pdfplumber page, with strategy
+    "text" (its words, and the images being encoded in submitted_images, (placement,
+    future) pairs from ImageEncoder.submit_page) or "raster" (see get_page_strategy).
+    Returns (images_data, page_data).
+    """
+    page_number = page.page_number - 1
+    images_data = []
+    page_data = {"page": page_number, "width": round(page.width, 2), "height": round(page.height, 2), "strategy": strategy}
+    if strategy == "raster":
+        page_html = []
+        png_bytes = rasterize_page(doc[page_number], image_dpi or RASTER_DPI)
+        images_data.append({
+            "page": page_number,
+            **({"data": png_bytes} if raw_images else {"base64": base64.b64encode(png_bytes).decode("utf-8")}),
+            "coordinates": {"x0": 0, "y0": 0, "width": page_data["width"], "height": page_data["height"]}
+        })
+        if text_layer:
+            page_data["text_layer"] = get_text_layer(doc[page_number])
+    else:
+        page_html = extract_text_from_page(page) if extract_chars else []
+
+    for placement, future in submitted_images:
+        png_bytes = future.result()
+        if raw_images:
+            image_entry = {"data": png_bytes}
+        else:
+            image_entry = {"base64": base64.b64encode(png_bytes).decode("utf-8")}
+        pdf_x0, pdf_y0, img_width, img_height = get_image_position(placement)
+        images_data.append({
+            "page": page_number,
+            **image_entry,
+            "coordinates": {
+                "x0": pdf_x0,
+                "y0": pdf_y0,
+                "width": img_width,
+                "height": img_height
+            }
+        })
+
+    page_data["text"] = page_html
+    return images_data, page_data
 
 # Main function to process the PDF and generate data
-def process_pdf(pdf_path):
+def process_pdf(pdf_path, page_numbers=None, raw_images=False, image_dpi=None, on_event=None, preflight_report=None, max_chars=None, text_layer=True):
+    """
+    on_event, if given, is called with a progress event after each page, and before
+    the first one when the whole document is processed.
+    With preflight_report (see pdf_preflight.py), pages without text skip the character
+    pipeline and pages without images skip image extraction.
+    Images are encoded by a thread pool while the text of their page is extracted.
+    With max_chars, pages with more characters are rendered as one image (with an
+    invisible text layer unless text_layer is False), and every page records its
+    "strategy", "text" or "raster".
+    """
+    start_time = time.time()
     images_data = []
     text_data = []
+    # Images being encoded, by page: the images of a page and of the next one are started
+    # before its text is extracted
+    submitted = {}
+    strategies = {}
 
     # Process images and text
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page in enumerate(pdf.pages):
-            page_html = extract_text_from_page(page)
-
-            images_on_page = page.images
-            for img_index, img in enumerate(images_on_page):
-                img_base64 = get_image_base64(pdf_path, page_number, img_index)
-                pdf_x0, pdf_y0, img_width, img_height = get_image_coordinates(pdf_path, page_number, img_index)
-                images_data.append({
-                    "page": page_number,
-                    "base64": img_base64,
-                    "coordinates": {
-                        "x0": pdf_x0,
-                        "y0": pdf_y0,
-                        "width": img_width,
-                        "height": img_height
-                    }
-                })
-
-            text_data.append({
-                "page": page_number,
-                "text": page_html
-            })
+    with fitz.open(pdf_path) as doc, pdfplumber.open(pdf_path) as pdf, ImageEncoder() as encoder:
+        if page_numbers is None:
+            page_numbers = range(len(pdf.pages))
+            if on_event:
+                on_event(start_event(pdf_path, len(pdf.pages)))
+
+        for index, page_number in enumerate(page_numbers):
+            page_start_time = time.time()
+            first_image = len(images_data)
+            for next_page in page_numbers[index:index + 2]:
+                if next_page not in strategies:
+                    strategies[next_page] = get_page_strategy(doc[next_page], max_chars, preflight_report["pages"][next_page] if preflight_report else None)
+                if next_page not in submitted and strategies[next_page] == "text" and (not preflight_report or preflight_report["pages"][next_page]["images"]):
+                    submitted[next_page] = encoder.submit_page(doc, doc[next_page], image_dpi)
+
+            page_check = preflight_report["pages"][page_number] if preflight_report else {"chars": 1, "images": 1}
+            page_images, page_data = process_page(doc, pdf.pages[page_number], strategies.pop(page_number), submitted.pop(page_number, []),
+                                                  raw_images, image_dpi, page_check["chars"], text_layer)
+            if not max_chars:
+                # Pages only record their strategy when they can be rasterized
+                del page_data["strategy"]
+            images_data.extend(page_images)
+            text_data.append(page_data)
+
+            if on_event:
+                on_event(page_event(page_number, len(pdf.pages), time.time() - page_start_time, start_time, page_data["text"], images_data[first_image:]))
 
     return images_data, text_data
 
 # Entry point
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python pdf_to_html.py <pdf_file>")
+        print("Usage: python pdf_to_html.py <pdf_file|output.json> [--lazy] [--split[=PAGES_PER_FILE]] [--output-dir=DIR] [--workers=N] [--thumbnails[=SIZE]] [--templates] [--image-dpi=DPI] [--progress] [--compress=gzip|zstd[:LEVEL]] [--fonts[=CACHE_DIR]] [--preflight] [--max-chars[=N]] [--no-text-layer]")
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
+    lazy = False
+    pages_per_file = None
+    output_dir = "output_pages"
+    workers = None
+    thumbnail_size = None
+    image_dpi = None
+    with_templates = False
+    on_event = None
+    compression = level = None
+    font_cache_dir = None
+    with_preflight = False
+    max_chars = None
+    text_layer = True
+    for arg in sys.argv[2:]:
+        if arg == "--lazy":
+            lazy = True
+        elif arg == "--split":
+            pages_per_file = 1
+        elif arg.startswith("--split="):
+            pages_per_file = int(arg.split("=", 1)[1])
+        elif arg.startswith("--output-dir="):
+            output_dir = arg.split("=", 1)[1]
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+        elif arg == "--progress":
+            on_event = make_ndjson_emitter()
+        elif arg == "--templates":
+            with_templates = True
+        elif arg == "--thumbnails":
+            thumbnail_size = THUMBNAIL_SIZE
+        elif arg.startswith("--thumbnails="):
+            thumbnail_size = int(arg.split("=", 1)[1])
+        elif arg.startswith("--image-dpi="):
+            image_dpi = int(arg.split("=", 1)[1])
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+        elif arg == "--preflight":
+            with_preflight = True
+        elif arg == "--max-chars":
+            max_chars = MAX_PAGE_CHARS
+        elif arg.startswith("--max-chars="):
+            max_chars = int(arg.split("=", 1)[1])
+        elif arg == "--no-text-layer":
+            text_layer = False
+        elif arg == "--fonts":
+            font_cache_dir = FONT_CACHE_DIR
+        elif arg.startswith("--fonts="):
+            font_cache_dir = arg.split("=", 1)[1]
+
+    if pages_per_file:
+        # Split output is rendered page group by page group in the workers, straight from the PDF
+        unsupported = [flag for flag, used in (("--lazy", lazy), ("--templates", with_templates), ("--preflight", with_preflight), ("--compress", compression)) if used]
+        if os.path.splitext(strip_compression_extension(pdf_path))[1].lower() in (".json", ".msgpack", ".cbor"):
+            unsupported.append("JSON/msgpack/CBOR input")
+        if unsupported:
+            print(f"--split does not support {', '.join(unsupported)}", file=sys.stderr)
+            sys.exit(1)
+        manifest = write_split_html(pdf_path, output_dir, pages_per_file, workers, thumbnail_size, image_dpi, on_event, font_cache_dir, max_chars, text_layer)
+        output_path = f"{output_dir}/manifest.json"
+        page_count = manifest["page_count"]
+        bytes_written = sum(entry["bytes"] + sum(asset["bytes"] for asset in entry["assets"]) for entry in manifest["files"])
+    else:
+        templates = None
+        fonts = None
+        if os.path.splitext(strip_compression_extension(pdf_path))[1].lower() in (".json", ".msgpack", ".cbor"):
+            # Rendering an existing pdf_to_json output instead of the PDF itself
+            images_data, text_data, templates = load_json_document(pdf_path)
+            pdf_path = None
+        else:
+            preflight_report = None
+            if with_preflight:
+                try:
+                    preflight_report = preflight(pdf_path)
+                except PreflightError as e:
+                    print(f"Preflight failed: {e}", file=sys.stderr)
+                    sys.exit(1)
+                log_preflight(preflight_report)
+            images_data, text_data = process_pdf(pdf_path, image_dpi=image_dpi, on_event=on_event, preflight_report=preflight_report, max_chars=max_chars, text_layer=text_layer)
+            if font_cache_dir:
+                fonts = extract_fonts(pdf_path, font_cache_dir)
+                print(f"Embedded fonts: {len(fonts)} ({sum(font['cached'] for font in fonts)} from the font cache)")
+
+        # JSON input may already carry the templates it was written with
+        if with_templates and templates is None:
+            templates = detect_templates(text_data)
+            text_data = apply_templates(text_data, templates)
+
+        if lazy:
+            html_content = generate_lazy_html(images_data, text_data, templates, fonts)
+        else:
+            html_content = generate_html(pdf_path, images_data, text_data, templates, fonts)
 
-    images_data, text_data = process_pdf(pdf_path)
-    html_content = generate_html(pdf_path, images_data, text_data)
+        output_path = add_compression_extension("output.html", compression)
+        with open_output(output_path, compression, level, text=True) as f:
+            f.write(html_content)
+        page_count = len(text_data)
+        bytes_written = os.path.getsize(output_path)
 
-    with open("output.html", "w", encoding="utf-8") as f:
-        f.write(html_content)
+    if on_event:
+        on_event(done_event(page_count, start_time, output_path, bytes_written))
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.html")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
@@ -1,56 +1,18 @@
 import fitz  # PyMuPDF
 import pdfplumber
 import base64
-from PIL import Image
-from io import BytesIO
 import re
 import sys
 import time
-import json
-
-def get_image_base64(pdf_path, page_number, img_index):
-    """
-    Retrieves an image from the PDF on the specified page and converts it to Base64 format.
-    """
-    doc = fitz.open(pdf_path)
-
-    # Extract images from each page
-    img_list = doc.get_page_images(page_number)
-    img = img_list[img_index]
-    base = fitz.Pixmap(doc, img[0])
-
-    if img[1]:  # If there is a mask
-        mask = fitz.Pixmap(doc, img[1])
-        pix = fitz.Pixmap(base, mask)
-    else:
-        pix = base
-
-    # Convert Pixmap to image
-    image_data = BytesIO(pix.tobytes("png"))
-    img_pil = Image.open(image_data)
-
-    # Convert image to Base64
-    buffered = BytesIO()
-    img_pil.save(buffered, format="PNG")
-    img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
-    return img_base64
-
-def get_image_position(pdf_path, page_number, img_index):
-    """
-    Retrieves the position (coordinates) of an image on the specified page.
-    """
-    with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[page_number]
-        images = page.images
-        img = images[img_index]
-        
-        # Image coordinates
-        pdf_x0, pdf_y0, pdf_x1, pdf_y1 = img["x0"], img["top"], img["x1"], img["bottom"]
-        img_width = abs(pdf_x1 - pdf_x0)
-        img_height = abs(pdf_y1 - pdf_y0)
-
-        return round(pdf_x0, 2), round(pdf_y0, 2), round(img_width, 2), round(img_height, 2)
+import os
+from pdf_binary_output import BINARY_FORMATS
+from pdf_thumbnails import THUMBNAIL_SIZE
+from pdf_images import get_page_image_placements, get_image_png, get_image_position
+from pdf_progress import make_ndjson_emitter, start_event, page_event, done_event
+from pdf_memprofile import MemoryProfiler
+from pdf_compact_coords import COORD_UNITS
+from pdf_compression import parse_compression, add_compression_extension
+from pdf_preflight import PreflightError, log_preflight
 
 def clean_font_name(font_name):
     font_name = font_name.split('+')[-1]
@@ -141,16 +103,15 @@ def extract_text_from_page(page):
     return words_data
 
 def get_pdf_metadata(pdf_path):
-    doc = fitz.open(pdf_path)
-    metadata = doc.metadata
-    return metadata
+    with fitz.open(pdf_path) as doc:
+        return doc.metadata
 
 def get_page_dimensions(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
         page = pdf.pages[0]
         return round(page.width, 2), round(page.height, 2)
 
-def generate_json(pdf_path, images_data, text_data, metadata, page_count):
+def generate_json(pdf_path, images_data, text_data, metadata, page_count, thumbnails=None, templates=None):
     pages_data = []
     for page_data in text_data:
         page_number = page_data['page']
@@ -164,12 +125,17 @@ def generate_json(pdf_path, images_data, text_data, metadata, page_count):
             "images": [],
             "text": page_data['text']
         }
+        if "templates" in page_data:
+            page_info["templates"] = page_data['templates']
+        if thumbnails:
+            page_info["thumbnail"] = thumbnails[page_number]
         
         for img_data in page_images:
-            img_base64 = img_data['base64']
+            # Binary outputs keep the raw PNG bytes under "data"
+            image_key = "base64" if "base64" in img_data else "data"
             pdf_x0, pdf_y0, img_width, img_height = img_data['position'].values()
             page_info["images"].append({
-                "base64": img_base64,
+                image_key: img_data[image_key],
                 "position": {
                     "x0": pdf_x0,
                     "y0": pdf_y0,
@@ -186,26 +152,44 @@ def generate_json(pdf_path, images_data, text_data, metadata, page_count):
         "page_count": page_count,  # Add overall page count
         "pages": pages_data
     }
+    if templates is not None:
+        result["templates"] = templates
     
     return result
 
-def process_pdf(pdf_path):
+def process_pdf(pdf_path, raw_images=False, image_dpi=None, on_event=None):
+    """
+    on_event, if given, is called with a progress event before the first page and after each page.
+    """
+    start_time = time.time()
     images_data = []
     text_data = []
+    # Downsampled images, shared by every placement of the same image
+    image_cache = {}
+
+    with fitz.open(pdf_path) as doc, pdfplumber.open(pdf_path) as pdf:
+        if on_event:
+            on_event(start_event(pdf_path, len(pdf.pages)))
 
-    with pdfplumber.open(pdf_path) as pdf:
         for page_number, page in enumerate(pdf.pages):
+            page_start_time = time.time()
+            first_image = len(images_data)
             page_html = extract_text_from_page(page)
 
-            images_on_page = page.images
-            page_width, page_height = get_page_dimensions(pdf_path)
-
-            for img_index, img in enumerate(images_on_page):
-                img_base64 = get_image_base64(pdf_path, page_number, img_index)
-                pdf_x0, pdf_y0, img_width, img_height = get_image_position(pdf_path, page_number, img_index)
+            fitz_page = doc[page_number]
+            # Each page has its own size (landscape pages in a portrait document)
+            page_width, page_height = round(page.width, 2), round(page.height, 2)
+
+            for placement in get_page_image_placements(fitz_page):
+                png_bytes = get_image_png(doc, fitz_page, placement, image_dpi, image_cache)
+                if raw_images:
+                    image_entry = {"data": png_bytes}
+                else:
+                    image_entry = {"base64": base64.b64encode(png_bytes).decode("utf-8")}
+                pdf_x0, pdf_y0, img_width, img_height = get_image_position(placement)
                 images_data.append({
                     "page": page_number,
-                    "base64": img_base64,
+                    **image_entry,
                     "position": {
                         "x0": pdf_x0,
                         "y0": pdf_y0,
@@ -221,25 +205,100 @@ def process_pdf(pdf_path):
                 "text": page_html
             })
 
-    metadata = get_pdf_metadata(pdf_path)
-    page_count = len(pdf.pages)
+            if on_event:
+                on_event(page_event(page_number, len(pdf.pages), time.time() - page_start_time, start_time, page_html, images_data[first_image:]))
+
+        metadata = doc.metadata
+        page_count = len(pdf.pages)
     return images_data, text_data, metadata, page_count
 
 if __name__ == "__main__":
+    # Imported here: pdf_convert builds on this module's extraction functions
+    from pdf_convert import convert, write_result, FileSink, IndexSink
+
+    usage = "Usage: python pdf_to_json.py <pdf_file> [--output=PATH] [--format=json|msgpack|cbor] [--index] [--thumbnails[=SIZE]] [--templates] [--image-dpi=DPI] [--image-threads=N] [--progress] [--memprofile[=PATH]] [--compact-coords[=UNITS_PER_POINT]] [--compress=gzip|zstd[:LEVEL]] [--preflight]"
     if len(sys.argv) < 2:
-        print("Usage: python pdf_to_json.py <pdf_file>")
+        print(usage)
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
 
-    images_data, text_data, metadata, page_count = process_pdf(pdf_path)
-    json_data = generate_json(pdf_path, images_data, text_data, metadata, page_count)
-
-    with open("output.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(json_data, indent=4))
+    output_format = "json"
+    output_path = None
+    compression = level = None
+    with_index = False
+    profile_path = None
+    options = {}
+    for arg in sys.argv[2:]:
+        if arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+        elif arg.startswith("--output="):
+            output_path = arg.split("=", 1)[1]
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+        elif arg == "--index":
+            with_index = True
+        elif arg == "--preflight":
+            options["preflight"] = True
+        elif arg == "--progress":
+            options["on_event"] = make_ndjson_emitter()
+        elif arg == "--compact-coords":
+            options["compact_coords"] = COORD_UNITS
+        elif arg.startswith("--compact-coords="):
+            options["compact_coords"] = int(arg.split("=", 1)[1])
+        elif arg == "--memprofile":
+            profile_path = "memprofile.json"
+        elif arg.startswith("--memprofile="):
+            profile_path = arg.split("=", 1)[1]
+        elif arg == "--templates":
+            # Repeated headers, footers and page numbers are stored once at document level
+            options["templates"] = True
+        elif arg == "--thumbnails":
+            options["thumbnail_size"] = THUMBNAIL_SIZE
+        elif arg.startswith("--thumbnails="):
+            options["thumbnail_size"] = int(arg.split("=", 1)[1])
+        elif arg.startswith("--image-dpi="):
+            options["image_dpi"] = int(arg.split("=", 1)[1])
+        elif arg.startswith("--image-threads="):
+            options["image_threads"] = int(arg.split("=", 1)[1])
+    if output_format != "json" and output_format not in BINARY_FORMATS:
+        print(usage)
+        sys.exit(1)
+    output_path = output_path or f"output.{output_format}"
+    index_path = os.path.splitext(output_path)[0] + ".index.json"
+    output_path = add_compression_extension(output_path, compression)
+    options["raw_images"] = output_format != "json"
+
+    if profile_path:
+        options["profiler"] = MemoryProfiler()
+        options["profiler"].start()
+
+    try:
+        result = convert(pdf_path, "json", options)
+    except PreflightError as e:
+        print(f"Preflight failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if result.preflight:
+        log_preflight(result.preflight)
+    page_count = result.header["page_count"]
+    # Compact coordinates go with compact JSON, indentation would outweigh what they save
+    sinks = [FileSink(output_path, output_format, indent=None if options.get("compact_coords") else 4, compression=compression, level=level)]
+    if with_index:
+        sinks.append(IndexSink(index_path))
+    write_result(result, *sinks)
+    if with_index:
+        print(f"Word index saved as {sinks[1].index_path}")
+
+    if profile_path:
+        options["profiler"].stop()
+        options["profiler"].write_summary(profile_path)
+        print(f"Memory profile saved as {profile_path}")
+
+    if "on_event" in options:
+        options["on_event"](done_event(page_count, start_time, output_path, os.path.getsize(output_path)))
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.json")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
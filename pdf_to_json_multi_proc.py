@@ -1,59 +1,30 @@
-import multiprocessing as mp
 import fitz  # PyMuPDF
 import pdfplumber
 import base64
-from PIL import Image
-from io import BytesIO
 import re
 import sys
 import time
 import json
-
-
-def get_image_base64(pdf_path, page_number, img_index):
-    """
-    Retrieves an image from the PDF on the specified page and converts it to Base64 format.
-    """
-    doc = fitz.open(pdf_path)
-
-    # Extract images from each page
-    img_list = doc.get_page_images(page_number)
-    img = img_list[img_index]
-    base = fitz.Pixmap(doc, img[0])
-
-    if img[1]:  # If there is a mask
-        mask = fitz.Pixmap(doc, img[1])
-        pix = fitz.Pixmap(base, mask)
-    else:
-        pix = base
-
-    # Convert Pixmap to image
-    image_data = BytesIO(pix.tobytes("png"))
-    img_pil = Image.open(image_data)
-
-    # Convert image to Base64
-    buffered = BytesIO()
-    img_pil.save(buffered, format="PNG")
-    img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
-    return img_base64
-
-
-def get_image_position(pdf_path, page_number, img_index):
-    """
-    Retrieves the position (coordinates) of an image on the specified page.
-    """
-    with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[page_number]
-        images = page.images
-        img = images[img_index]
-        
-        # Image coordinates
-        pdf_x0, pdf_y0, pdf_x1, pdf_y1 = img["x0"], img["top"], img["x1"], img["bottom"]
-        img_width = abs(pdf_x1 - pdf_x0)
-        img_height = abs(pdf_y1 - pdf_y0)
-
-        return round(pdf_x0, 2), round(pdf_y0, 2), round(img_width, 2), round(img_height, 2)
+import signal
+import atexit
+import math
+import tempfile
+import shutil
+import os
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+from pdf_binary_output import BINARY_FORMATS, write_binary
+from pdf_word_index import build_index, write_index
+from pdf_page_templates import detect_templates, apply_templates
+from pdf_images import ImageEncoder, get_image_executor, get_image_position
+from pdf_progress import make_ndjson_emitter, start_event, page_event, done_event, get_page_stats
+from pdf_convert import FileSink, encode_page
+from pdf_compression import parse_compression, add_compression_extension, open_output
+from pdf_thumbnails import THUMBNAIL_SIZE, render_thumbnails, load_thumbnails
+from pdf_planner import plan_execution, log_plan, get_mp_context
 
 
 def clean_font_name(font_name):
@@ -148,9 +119,8 @@ def extract_text_from_page(page):
 
 
 def get_pdf_metadata(pdf_path):
-    doc = fitz.open(pdf_path)
-    metadata = doc.metadata
-    return metadata
+    with fitz.open(pdf_path) as doc:
+        return doc.metadata
 
 
 def get_page_dimensions(pdf_path):
@@ -159,63 +129,90 @@ def get_page_dimensions(pdf_path):
         return round(page.width, 2), round(page.height, 2)
 
 
-def generate_json(pdf_path, images_data, text_data, metadata, page_count):
+def get_page_info(page_data, thumbnail=None):
+    page_number = page_data['page']
+    page_info = {
+        "page_number": page_number + 1,
+        "size": {
+            "width": page_data['width'],
+            "height": page_data['height']
+        },
+        "images": [],
+        "text": page_data['text']
+    }
+    if "templates" in page_data:
+        page_info["templates"] = page_data['templates']
+    if thumbnail:
+        page_info["thumbnail"] = thumbnail
+    if page_data.get("degraded"):
+        # The page went over its budget and was produced by a cheaper strategy
+        page_info["degraded"] = True
+        page_info["strategy"] = page_data["strategy"]
+
+    for img_data in page_data['images']:
+        # Binary outputs keep the raw PNG bytes under "data"
+        image_key = "base64" if "base64" in img_data else "data"
+        pdf_x0, pdf_y0, img_width, img_height = img_data['position'].values()
+        page_info["images"].append({
+            image_key: img_data[image_key],
+            "position": {
+                "x0": pdf_x0,
+                "y0": pdf_y0,
+                "width": img_width,
+                "height": img_height
+            }
+        })
+    return page_info
+
+def get_document_header(pdf_path, metadata, page_count):
+    return {
+        "pdf_name": pdf_path.split("/")[-1],
+        "metadata": metadata,  # Add the metadata here
+        "page_count": page_count  # Add overall page count
+    }
+
+def generate_json(pdf_path, images_data, text_data, metadata, page_count, thumbnails=None, templates=None):
     pages_data = []
     for page_data in text_data:
         page_number = page_data['page']
         page_images = [img for img in images_data if img['page'] == page_number]
-        
-        page_info = {
-            "page_number": page_number + 1,
-            "size": {
-                "width": page_data['width'],
-                "height": page_data['height']
-            },
-            "images": [],
-            "text": page_data['text']
-        }
-        
-        for img_data in page_images:
-            img_base64 = img_data['base64']
-            pdf_x0, pdf_y0, img_width, img_height = img_data['position'].values()
-            page_info["images"].append({
-                "base64": img_base64,
-                "position": {
-                    "x0": pdf_x0,
-                    "y0": pdf_y0,
-                    "width": img_width,
-                    "height": img_height
-                }
-            })
-
-        pages_data.append(page_info)
+        pages_data.append(get_page_info({**page_data, "images": page_images}, thumbnails[page_number] if thumbnails else None))
 
     result = {
-        "pdf_name": pdf_path.split("/")[-1],
-        "metadata": metadata,  # Add the metadata here
-        "page_count": page_count,  # Add overall page count
+        **get_document_header(pdf_path, metadata, page_count),
         "pages": pages_data  # Each page has a "page_number"
     }
+    if templates is not None:
+        result["templates"] = templates
     
     return result
 
 
 
-def process_page(page_number, pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[page_number]
-        page_html = extract_text_from_page(page)
-        page_width, page_height = get_page_dimensions(pdf_path)
-    
-    images_on_page = page.images
-    images_data = []
+def process_page(page_number, pdf_path, raw_images=False, image_dpi=None):
+    with fitz.open(pdf_path) as doc:
+        fitz_page = doc[page_number]
+        # Images are encoded by the thread pool of this process while the text is extracted.
+        # The encoder is per page, so identical images are shared within the page only.
+        encoder = ImageEncoder(executor=get_image_executor())
+        submitted = encoder.submit_page(doc, fitz_page, image_dpi)
 
-    for img_index, img in enumerate(images_on_page):
-        img_base64 = get_image_base64(pdf_path, page_number, img_index)
-        pdf_x0, pdf_y0, img_width, img_height = get_image_position(pdf_path, page_number, img_index)
+        with pdfplumber.open(pdf_path) as pdf:
+            page = pdf.pages[page_number]
+            page_html = extract_text_from_page(page)
+            page_width, page_height = round(page.width, 2), round(page.height, 2)
+
+    images_data = []
+    for placement, future in submitted:
+        png_bytes = future.result()
+        if raw_images:
+            image_entry = {"data": png_bytes}
+        else:
+            image_entry = {"base64": base64.b64encode(png_bytes).decode("utf-8")}
+        pdf_x0, pdf_y0, img_width, img_height = get_image_position(placement)
         images_data.append({
             "page": page_number,
-            "base64": img_base64,
+            **image_entry,
             "position": {
                 "x0": pdf_x0,
                 "y0": pdf_y0,
@@ -233,40 +230,415 @@ def process_page(page_number, pdf_path):
     }
 
 
-def process_pdf_parallel(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-        page_count = len(pdf.pages)
+class PageBudgetExceeded(Exception):
+    pass
+
+
+def extract_text_with_pymupdf(fitz_page, clip=None):
+    """
+    Cheaper text extraction for pages over budget: one record per PyMuPDF span
+    instead of per word, with the same keys as extract_text_from_page.
+    With clip, a rectangle of the page, only the text inside it is extracted.
+    """
+    words_data = []
+    for block in fitz_page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT, clip=clip)["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                color = span["color"]
+                color_str = f"rgb({(color >> 16) & 255}, {(color >> 8) & 255}, {color & 255})"
+                flags = span["flags"]
+                append_word(words_data, span["text"], span["size"], clean_font_name(span["font"]),
+                            "bold" if flags & fitz.TEXT_FONT_BOLD else "normal",
+                            "italic" if flags & fitz.TEXT_FONT_ITALIC else "normal",
+                            color_str, span["bbox"][0], span["bbox"][1],
+                            is_superscript=bool(flags & fitz.TEXT_FONT_SUPERSCRIPT))
+    return words_data
+
+
+def process_page_pymupdf(page_number, pdf_path, raw_images=False, image_dpi=None):
+    """
+    Fallback strategy: text spans from PyMuPDF, no images.
+    """
+    with fitz.open(pdf_path) as doc:
+        fitz_page = doc[page_number]
+        return {
+            "page": page_number,
+            "width": round(fitz_page.rect.width, 2),
+            "height": round(fitz_page.rect.height, 2),
+            "text": extract_text_with_pymupdf(fitz_page),
+            "images": []
+        }
+
+
+def process_page_raster(page_number, pdf_path, raw_images=False, image_dpi=None):
+    """
+    Last-resort strategy: the whole page rendered as a single image, no text.
+    """
+    with fitz.open(pdf_path) as doc:
+        fitz_page = doc[page_number]
+        png_bytes = fitz_page.get_pixmap(dpi=image_dpi or 72, alpha=False).tobytes("png")
+        page_width, page_height = round(fitz_page.rect.width, 2), round(fitz_page.rect.height, 2)
+
+    image_entry = {"data": png_bytes} if raw_images else {"base64": base64.b64encode(png_bytes).decode("utf-8")}
+    return {
+        "page": page_number,
+        "width": page_width,
+        "height": page_height,
+        "text": [],
+        "images": [{
+            "page": page_number,
+            **image_entry,
+            "position": {"x0": 0, "y0": 0, "width": page_width, "height": page_height}
+        }]
+    }
+
+
+def get_empty_page(page_number, pdf_path):
+    try:
+        with fitz.open(pdf_path) as doc:
+            rect = doc[page_number].rect
+            page_width, page_height = round(rect.width, 2), round(rect.height, 2)
+    except Exception:
+        page_width = page_height = 0
+    return {"page": page_number, "width": page_width, "height": page_height, "text": [], "images": [], "strategy": "none", "degraded": True}
 
-    # Using Pool for parallel processing pages
-    with mp.Pool(mp.cpu_count()) as pool:
-        results = pool.starmap(process_page, [(page_number, pdf_path) for page_number in range(page_count)])
 
-    return results
+# Strategies tried in order when a page goes over its time or memory budget
+PAGE_STRATEGIES = [
+    ("full", process_page),
+    ("pymupdf", process_page_pymupdf),
+    ("raster", process_page_raster)
+]
+
+# Per-process start times of every page, shared with the parent (set by init_worker)
+page_started = None
+
+
+def raise_budget_exceeded(signum, frame):
+    raise PageBudgetExceeded("Page time budget exceeded")
+
+
+def init_worker(started, memory_limit_mb):
+    global page_started
+    page_started = started
+    if memory_limit_mb and resource is not None:
+        # Allocations past the limit raise MemoryError inside the page, which triggers a fallback
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, raise_budget_exceeded)
+
+
+def process_page_with_budget(page_number, pdf_path, raw_images=False, page_timeout=None, image_dpi=None):
+    """
+    Processes a page with each strategy in turn until one finishes within page_timeout
+    seconds (and the worker memory limit). Pages not produced by the full strategy are
+    marked as degraded; if every strategy fails the page is returned empty.
+    The time spent on the page is returned under "elapsed".
+    """
+    page_start_time = time.time()
+    if page_started is not None:
+        page_started[page_number] = page_start_time
+
+    use_timer = page_timeout and hasattr(signal, "setitimer")
+    for strategy, process in PAGE_STRATEGIES:
+        try:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, page_timeout)
+            result = process(page_number, pdf_path, raw_images, image_dpi)
+        except Exception as e:  # Includes PageBudgetExceeded and MemoryError
+            print(f"Page {page_number + 1}: {strategy} strategy failed ({type(e).__name__}: {e})", file=sys.stderr)
+            continue
+        finally:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+        result["strategy"] = strategy
+        result["degraded"] = strategy != "full"
+        result["elapsed"] = time.time() - page_start_time
+        return result
+
+    result = get_empty_page(page_number, pdf_path)
+    result["elapsed"] = time.time() - page_start_time
+    return result
+
+
+def write_fragment(fragment_path, data):
+    """
+    Writes a fragment under a temporary name and renames it into place, so a fragment
+    is only ever seen whole, even if its writer is killed or a stalled one wakes up.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(fragment_path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, fragment_path)
+
+
+def write_page_fragment(page_data, output_format, fragment_dir, thumbnail=None, suffix=""):
+    """
+    Encodes a page into its own file in fragment_dir, ready to be appended to the output.
+    """
+    fragment_path = os.path.join(fragment_dir, f"page-{page_data['page']:05d}{suffix}")
+    write_fragment(fragment_path, encode_page(get_page_info(page_data, thumbnail), output_format))
+    return fragment_path
+
+
+def process_page_to_fragment(page_number, pdf_path, raw_images, page_timeout, image_dpi, output_format, fragment_dir, thumbnail_path=None):
+    """
+    Processes a page and serializes it in the worker. Only a small summary is sent back
+    to the parent, which concatenates the fragments in page order.
+    """
+    page_data = process_page_with_budget(page_number, pdf_path, raw_images, page_timeout, image_dpi)
+    thumbnail = load_thumbnails([thumbnail_path], raw=raw_images)[0] if thumbnail_path else None
+    return {
+        "page": page_number,
+        "fragment": write_page_fragment(page_data, output_format, fragment_dir, thumbnail),
+        "strategy": page_data["strategy"],
+        "degraded": page_data["degraded"],
+        "elapsed": page_data["elapsed"],
+        "stats": get_page_stats(page_data["text"], page_data["images"])
+    }
+
+
+# The pool of the last document, kept for the next one (see get_pool)
+pool_cache = {}
+
+
+def get_pool(workers, memory_limit_mb, max_tasks_per_child, page_count):
+    """
+    Returns a pool of forkserver workers with fitz and pdfplumber preloaded, and the shared
+    array the workers record page start times in. The pool is reused by later documents
+    processed with the same settings, so a batch of documents pays for startup once.
+    """
+    key = (workers, memory_limit_mb, max_tasks_per_child)
+    cached = pool_cache.get("pool")
+    if cached and cached["key"] == key and len(cached["started"]) >= page_count:
+        return cached["pool"], cached["started"]
+
+    close_pool()
+    ctx = get_mp_context()
+    # Sized for longer documents too, so the pool does not need replacing for each one
+    started = ctx.Array("d", max(1024, 2 ** math.ceil(math.log2(max(page_count, 1)))), lock=False)
+    pool = ctx.Pool(workers, initializer=init_worker, initargs=(started, memory_limit_mb), maxtasksperchild=max_tasks_per_child)
+    pool_cache["pool"] = {"key": key, "pool": pool, "started": started}
+    return pool, started
+
+
+def close_pool(terminate=False):
+    cached = pool_cache.pop("pool", None)
+    if cached is None:
+        return
+    if terminate:
+        cached["pool"].terminate()
+    else:
+        cached["pool"].close()
+        cached["pool"].join()
+
+
+atexit.register(close_pool, True)
+
+
+def process_pdf_parallel(pdf_path, raw_images=False, page_timeout=None, memory_limit_mb=None, max_tasks_per_child=None, image_dpi=None, on_event=None,
+                         fragment_dir=None, output_format="json", thumbnail_paths=None, workers=None):
+    """
+    Processes all pages across a process pool. page_timeout (seconds) and memory_limit_mb
+    are enforced inside the workers; workers are replaced after max_tasks_per_child pages.
+    A page whose worker stops responding altogether is returned empty and degraded.
+    on_event, if given, receives progress events in the parent as pages complete.
+    With fragment_dir, workers write each page encoded in output_format to that directory
+    and the results are summaries with the fragment path instead of the page data.
+    workers is the pool size; by default pdf_planner picks it, and documents too small
+    to be worth a pool are processed serially in this process.
+    """
+    start_time = time.time()
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    if workers is None:
+        plan = plan_execution(pdf_path)
+        log_plan(plan, on_event)
+        workers = plan["workers"]
+    if on_event:
+        on_event(start_event(pdf_path, page_count))
+
+    results = {}
+
+    def report(page_number):
+        if on_event:
+            page_data = results[page_number]
+            event = page_event(page_number, page_count, page_data["elapsed"], start_time, page_data.get("text"), page_data.get("images"), page_data.get("stats"))
+            if page_data["degraded"]:
+                event["strategy"] = page_data["strategy"]
+            on_event(event)
+
+    if workers <= 1:
+        # Same work as the pool workers, in this process. The memory limit is left out:
+        # it would apply to this whole process rather than to one page
+        use_alarm = page_timeout and hasattr(signal, "SIGALRM")
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, raise_budget_exceeded)
+        try:
+            for page_number in range(page_count):
+                if fragment_dir:
+                    results[page_number] = process_page_to_fragment(page_number, pdf_path, raw_images, page_timeout, image_dpi, output_format, fragment_dir,
+                                                                    thumbnail_paths[page_number] if thumbnail_paths else None)
+                else:
+                    results[page_number] = process_page_with_budget(page_number, pdf_path, raw_images, page_timeout, image_dpi)
+                report(page_number)
+        finally:
+            # The handler belongs to the caller's process, so it is put back
+            if use_alarm:
+                signal.signal(signal.SIGALRM, previous_handler if previous_handler is not None else signal.SIG_DFL)
+        return [results[page_number] for page_number in range(page_count)]
+
+    # Worker-side timers can't interrupt long calls into native code, so the parent
+    # gives up on a page once every strategy has had its full budget
+    hard_timeout = page_timeout * (len(PAGE_STRATEGIES) + 1) if page_timeout else None
+    pool, started = get_pool(workers, memory_limit_mb, max_tasks_per_child, page_count)
+    started[:page_count] = [0.0] * page_count
+    stalled = False
+
+    if fragment_dir:
+        pending = {
+            page_number: pool.apply_async(process_page_to_fragment, (page_number, pdf_path, raw_images, page_timeout, image_dpi, output_format, fragment_dir,
+                                                                     thumbnail_paths[page_number] if thumbnail_paths else None))
+            for page_number in range(page_count)
+        }
+    else:
+        pending = {
+            page_number: pool.apply_async(process_page_with_budget, (page_number, pdf_path, raw_images, page_timeout, image_dpi))
+            for page_number in range(page_count)
+        }
+    while pending:
+        next(iter(pending.values())).wait(0.05)
+        for page_number, async_result in list(pending.items()):
+            if async_result.ready():
+                results[page_number] = async_result.get()
+            elif hard_timeout and started[page_number] and time.time() - started[page_number] > hard_timeout:
+                print(f"Page {page_number + 1}: worker did not respond, page skipped", file=sys.stderr)
+                stalled = True
+                results[page_number] = get_empty_page(page_number, pdf_path)
+                results[page_number]["elapsed"] = time.time() - started[page_number]
+                if fragment_dir:
+                    # Not the worker's file name: the stalled worker may still write its own
+                    results[page_number]["fragment"] = write_page_fragment(results[page_number], output_format, fragment_dir, suffix=".timeout")
+            else:
+                continue
+            del pending[page_number]
+            report(page_number)
+
+    if stalled:
+        # A stuck worker would hold its slot forever, so the next document gets a fresh pool
+        close_pool(terminate=True)
+
+    return [results[page_number] for page_number in range(page_count)]
 
 
 if __name__ == "__main__":
+    usage = "Usage: python pdf_to_json_multi_proc.py <pdf_file> [--format=json|msgpack|cbor] [--index] [--thumbnails[=SIZE]] [--templates] [--page-timeout=SECONDS] [--page-memory=MB] [--max-tasks=N] [--workers=N] [--image-dpi=DPI] [--progress] [--compress=gzip|zstd[:LEVEL]]"
     if len(sys.argv) < 2:
-        print("Usage: python pdf_to_json_multi_proc.py <pdf_file>")
+        print(usage)
         sys.exit(1)
 
     start_time = time.time()
     pdf_path = sys.argv[1]
 
-    # Parallel process
-    text_data = process_pdf_parallel(pdf_path)
+    output_format = "json"
+    with_index = False
+    on_event = None
+    with_templates = False
+    thumbnail_size = None
+    image_dpi = None
+    page_timeout = None
+    memory_limit_mb = None
+    max_tasks_per_child = None
+    compression = level = None
+    workers = None
+    for arg in sys.argv[2:]:
+        if arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+        elif arg == "--index":
+            with_index = True
+        elif arg == "--progress":
+            on_event = make_ndjson_emitter()
+        elif arg == "--templates":
+            with_templates = True
+        elif arg == "--thumbnails":
+            thumbnail_size = THUMBNAIL_SIZE
+        elif arg.startswith("--thumbnails="):
+            thumbnail_size = int(arg.split("=", 1)[1])
+        elif arg.startswith("--image-dpi="):
+            image_dpi = int(arg.split("=", 1)[1])
+        elif arg.startswith("--page-timeout="):
+            page_timeout = float(arg.split("=", 1)[1])
+        elif arg.startswith("--page-memory="):
+            memory_limit_mb = int(arg.split("=", 1)[1])
+        elif arg.startswith("--max-tasks="):
+            max_tasks_per_child = int(arg.split("=", 1)[1])
+        elif arg.startswith("--compress="):
+            compression, level = parse_compression(arg.split("=", 1)[1])
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+    if output_format != "json" and output_format not in BINARY_FORMATS:
+        print(usage)
+        sys.exit(1)
 
-    images_data = []
-    for page_data in text_data:
-        images_data.extend(page_data['images'])
+    output_path = add_compression_extension(f"output.{output_format}", compression)
+    if with_templates or with_index:
+        # Templates and the word index need the text of every page in this process
+        text_data = process_pdf_parallel(pdf_path, output_format != "json", page_timeout, memory_limit_mb, max_tasks_per_child, image_dpi, on_event, workers=workers)
+
+        images_data = []
+        for page_data in text_data:
+            images_data.extend(page_data['images'])
+
+        metadata = get_pdf_metadata(pdf_path)
+        page_count = len(text_data)
+
+        thumbnails = None
+        if thumbnail_size:
+            # Rendered thumbnails are cached per page in thumbnails/ and reused on later runs
+            thumbnail_paths = render_thumbnails(pdf_path, "thumbnails", thumbnail_size)
+            thumbnails = load_thumbnails(thumbnail_paths, raw=output_format != "json")
 
-    metadata = get_pdf_metadata(pdf_path)
-    page_count = len(text_data)
-    json_data = generate_json(pdf_path, images_data, text_data, metadata, page_count)
+        templates = None
+        page_text_data = text_data
+        if with_templates:
+            # Repeated headers, footers and page numbers are stored once at document level
+            templates = detect_templates(text_data)
+            page_text_data = apply_templates(text_data, templates)
 
-    with open("output.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps(json_data, indent=4))
+        json_data = generate_json(pdf_path, images_data, page_text_data, metadata, page_count, thumbnails, templates)
+
+        if output_format == "json":
+            with open_output(output_path, compression, level, text=True) as f:
+                f.write(json.dumps(json_data, indent=4))
+        else:
+            write_binary(json_data, output_path, output_format, compression, level)
+    else:
+        # Workers serialize their own pages; this process only concatenates the encoded
+        # fragments, so page data is never pickled back or held here all at once
+        thumbnail_paths = render_thumbnails(pdf_path, "thumbnails", thumbnail_size) if thumbnail_size else None
+        fragment_dir = tempfile.mkdtemp(prefix="pdf-pages-", dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            pages = process_pdf_parallel(pdf_path, output_format != "json", page_timeout, memory_limit_mb, max_tasks_per_child, image_dpi, on_event,
+                                         fragment_dir, output_format, thumbnail_paths, workers)
+            page_count = len(pages)
+            sink = FileSink(output_path, output_format, compression=compression, level=level)
+            sink.open(get_document_header(pdf_path, get_pdf_metadata(pdf_path), page_count))
+            for page in pages:
+                sink.write_encoded(fragment_path=page["fragment"])
+            sink.close()
+        finally:
+            shutil.rmtree(fragment_dir, ignore_errors=True)
+
+    if with_index:
+        write_index(build_index(page_text_data, templates), "output.index.json")
+        print("Word index saved as output.index.json")
+
+    if on_event:
+        on_event(done_event(page_count, start_time, output_path, os.path.getsize(output_path)))
 
     end_time = time.time()
     execution_time = end_time - start_time
-    print(f"✅ Done processing! File saved as output.json")
+    print(f"✅ Done processing! File saved as {output_path}")
     print(f"Execution time: {execution_time} seconds")
@@ -1,32 +1,13 @@
 import fitz  # PyMuPDF
 import pdfplumber
-import base64
-from PIL import Image
 from io import BytesIO
 import re
 import sys
 import time
 from pymongo import MongoClient
-
-def get_image_base64(doc, page_number, img_index):
-    img_list = doc[page_number].get_images()
-    img = img_list[img_index]
-    base = fitz.Pixmap(doc, img[0])
-    if img[1]:
-        mask = fitz.Pixmap(doc, img[1])
-        pix = fitz.Pixmap(base, mask)
-    else:
-        pix = base
-
-    image_data = BytesIO(pix.tobytes("png"))
-    img_pil = Image.open(image_data)
-    buffered = BytesIO()
-    img_pil.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-def get_image_position(page, img_index):
-    img = page.images[img_index]
-    return round(img["x0"], 2), round(img["top"], 2), round(img["x1"] - img["x0"], 2), round(img["bottom"] - img["top"], 2)
+from pdf_input import STREAM_FORMATS, BATCH_SIZE, open_pdf_input, ingest_document_stream, report_input_memory, get_peak_memory_mb
+from pdf_compression import parse_compression, compress_payload
+from pdf_images import get_page_image_placements, get_image_base64, get_image_position
 
 def clean_font_name(font_name):
     font_name = font_name.split('+')[-1]
@@ -138,29 +119,52 @@ def generate_json(images_data, text_data, metadata, page_count, user_id, pdf_nam
         "uid": user_id
     }
 
-def save_to_mongodb(data, user_id, mongo_uri, db_name="ol_pdf_to_json", collection_name="pdf_to_json_books"):
+def save_to_mongodb(data, user_id, mongo_uri, db_name="ol_pdf_to_json", collection_name="pdf_to_json_books", compression=None, level=None):
+    """
+    With compression ("gzip" or "zstd"), the pages ("p") are stored as one compressed
+    binary payload "p_z"; pdf_compression.expand_payload restores them.
+    """
     client = MongoClient(mongo_uri)
     try:
         db = client[db_name]
         collection = db[collection_name]
+        if compression:
+            data = compress_payload(data, "p", compression, level)
         result = collection.insert_one(data)
         print(f"Saved to MongoDB with _id: {result.inserted_id}")
     finally:
         client.close()
 
-def process_pdf_from_stream(pdf_bytes):
+def convert_stream_document(header, pdf_path, pdf_map, compression=None, level=None):
+    """
+    Converts one document of a multi-document stream into the document to store.
+    """
+    images_data, text_data, metadata, page_count = process_pdf_from_stream(pdf_map, pdf_path)
+    data = generate_json(images_data, text_data, metadata, page_count, header["userId"], header["file_name"])
+    return compress_payload(data, "p", compression, level) if compression else data
+
+def process_pdf_from_stream(pdf_stream, pdf_path=None):
+    """
+    Processes a PDF given as bytes, or as a memory-mapped file (pdf_stream) together
+    with its path, in which case neither library makes its own copy of the document.
+    """
     images_data, text_data = [], []
 
-    pdf_buffer = BytesIO(pdf_bytes)
-    doc = fitz.open(stream=pdf_buffer, filetype="pdf")
+    if pdf_path:
+        doc = fitz.open(pdf_path)
+        pdf_buffer = pdf_stream
+    else:
+        pdf_buffer = BytesIO(pdf_stream)
+        doc = fitz.open(stream=pdf_buffer, filetype="pdf")
+        pdf_buffer.seek(0)
 
-    pdf_buffer.seek(0)
     with pdfplumber.open(pdf_buffer) as pdf:
         for page_number, page in enumerate(pdf.pages):
             words = extract_text_from_page(page)
-            for img_index, _ in enumerate(page.images):
-                base64_img = get_image_base64(doc, page_number, img_index)
-                pos = get_image_position(page, img_index)
+            fitz_page = doc[page_number]
+            for placement in get_page_image_placements(fitz_page):
+                base64_img = get_image_base64(doc, fitz_page, placement)
+                pos = get_image_position(placement)
                 images_data.append({
                     "page": page_number,
                     "base64": base64_img,
@@ -179,19 +183,37 @@ def process_pdf_from_stream(pdf_bytes):
     return images_data, text_data, metadata, len(doc)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: cat file.pdf | python script.py <userId> <mongo_uri>")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    stream_format = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--stream=")), None)
+    if len(args) < (1 if stream_format else 2) or (stream_format and stream_format not in STREAM_FORMATS):
+        print("Usage: cat file.pdf | python script.py <userId> <mongo_uri> [--input=<path|fd:N>] [--compress=gzip|zstd[:LEVEL]]\n"
+              "       cat documents | python script.py <mongo_uri> --stream=framed|tar [--batch-size=N] [--input=<path|fd:N>] [--compress=gzip|zstd[:LEVEL]]")
         sys.exit(1)
 
-    user_id = sys.argv[1]
-    mongo_uri = sys.argv[2]
-    pdf_bytes = sys.stdin.buffer.read()
+    input_source = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--input=")), "-")
+    compress = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--compress=")), None)
+    compression, level = parse_compression(compress) if compress else (None, None)
 
     start = time.time()
-    images_data, text_data, metadata, page_count = process_pdf_from_stream(pdf_bytes)
+    if stream_format:
+        # Many documents, each with its own userId and file name, through one process and connection
+        mongo_uri = args[0]
+        batch_size = int(next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--batch-size=")), BATCH_SIZE))
+        saved, failed = ingest_document_stream(input_source, stream_format, lambda header, pdf_path, pdf_map: convert_stream_document(header, pdf_path, pdf_map, compression, level),
+                                               mongo_uri, "ol_pdf_to_json", "pdf_to_json_books", "pdf", batch_size)
+        print(f"{saved} documents saved, {failed} failed, peak memory: {get_peak_memory_mb()} MB")
+        print(f"Done in {round(time.time() - start, 2)} seconds")
+        sys.exit(1 if failed else 0)
+
+    user_id = args[0]
+    mongo_uri = args[1]
+    # stdin is spooled to a temporary file and memory-mapped rather than read into memory
+    with open_pdf_input(input_source) as (pdf_path, pdf_map):
+        images_data, text_data, metadata, page_count = process_pdf_from_stream(pdf_map, pdf_path)
+        report_input_memory(pdf_map)
     json_data = generate_json(images_data, text_data, metadata, page_count, user_id, "stdin.pdf")
 
-    save_to_mongodb(json_data, user_id, mongo_uri)
+    save_to_mongodb(json_data, user_id, mongo_uri, compression=compression, level=level)
 
     print(f"Done in {round(time.time() - start, 2)} seconds")
 
@@ -0,0 +1,160 @@
+import unicodedata
+import re
+import sys
+import json
+from pdf_page_templates import expand_templates
+
+# Size of a spatial grid cell, in PDF points
+CELL_SIZE = 64
+
+
+def normalize_token(word):
+    """
+    Normalizes a word for lookups: Unicode NFKC and case folding.
+    Returns None for runs that are not searchable (spaces, punctuation).
+    """
+    token = unicodedata.normalize("NFKC", word).casefold().strip()
+    return token if token.isalnum() else None
+
+
+def get_run_bbox(word_data):
+    """
+    Estimates the bounding box of a run from its origin and font size.
+    The word records do not keep the glyph widths, so an average advance of
+    half the font size per character is assumed.
+    """
+    x0, y0, font_size = word_data["x"], word_data["y"], word_data["font_size"]
+    return [x0, y0, round(x0 + len(word_data["word"]) * font_size * 0.5, 2), round(y0 + font_size, 2)]
+
+
+def get_cells(bbox, cell_size):
+    x0, y0, x1, y1 = bbox[:4]
+    for cx in range(int(x0 // cell_size), int(x1 // cell_size) + 1):
+        for cy in range(int(y0 // cell_size), int(y1 // cell_size) + 1):
+            yield f"{cx},{cy}"
+
+
+def create_index(cell_size=CELL_SIZE):
+    return {
+        "cell_size": cell_size,
+        "tokens": {},  # token -> [[page, run_id, x, y], ...]
+        "pages": {}  # page -> {"runs": [[x0, y0, x1, y1, word], ...], "grid": {"cx,cy": [run_id, ...]}}
+    }
+
+
+def add_page(index, page_number, words):
+    """
+    Adds the word records of one page to the index. Pages may be added in any order.
+    """
+    runs = []
+    grid = {}
+    for run_id, word_data in enumerate(words):
+        bbox = get_run_bbox(word_data)
+        runs.append(bbox + [word_data["word"]])
+        for cell in get_cells(bbox, index["cell_size"]):
+            grid.setdefault(cell, []).append(run_id)
+
+        token = normalize_token(word_data["word"])
+        if token:
+            index["tokens"].setdefault(token, []).append([page_number, run_id, word_data["x"], word_data["y"]])
+
+    index["pages"][str(page_number)] = {"runs": runs, "grid": grid}
+
+
+def add_output_page(index, page_number, words, references=None, templates=None):
+    """
+    Adds a page as it is written to the output. With templates (see pdf_page_templates),
+    the page's template references are expanded first, so run ids are those of the runs a
+    reader gets back from expand_templates, whichever converter wrote the document.
+    """
+    if templates:
+        words = expand_templates(words, references or [], templates)
+    add_page(index, page_number, words)
+
+
+def build_index(text_data, templates=None, cell_size=CELL_SIZE):
+    """
+    Builds the index from the text_data list produced by process_pdf, with templates
+    already applied to it when the output has templates.
+    """
+    index = create_index(cell_size)
+    for page_data in text_data:
+        add_output_page(index, page_data["page"], page_data["text"], page_data.get("templates"), templates)
+    return index
+
+
+def write_index(index, index_path):
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(index, ensure_ascii=False))
+
+
+def load_index(index_path):
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def search(index, query):
+    """
+    Finds a word or phrase. Returns a list of hits, one per occurrence:
+    {"page", "run_ids", "x", "y"}, where x and y are the origin of the first run.
+    The words of a phrase must follow each other on the same page, separated
+    by at most one non-searchable run (a space or punctuation). Punctuation in
+    the query is ignored.
+    """
+    tokens = [normalize_token(part) for part in re.findall(r"\w+", query)]
+    tokens = [token for token in tokens if token]
+    if not tokens:
+        return []
+
+    postings = [index["tokens"].get(token, []) for token in tokens]
+    if not all(postings):
+        return []
+
+    # (page, run_id) lookups for the following words of the phrase
+    following = [{(page, run_id) for page, run_id, _, _ in hits} for hits in postings[1:]]
+
+    results = []
+    for page, run_id, x, y in postings[0]:
+        run_ids = [run_id]
+        for positions in following:
+            next_id = next((run_ids[-1] + step for step in (1, 2) if (page, run_ids[-1] + step) in positions), None)
+            if next_id is None:
+                break
+            run_ids.append(next_id)
+        else:
+            results.append({"page": page, "run_ids": run_ids, "x": x, "y": y})
+
+    return results
+
+
+def query_rect(index, page_number, x0, y0, x1, y1):
+    """
+    Returns the runs of a page whose bounding boxes intersect the given rectangle,
+    as {"run_id", "bbox", "word"} dictionaries in reading order.
+    """
+    page = index["pages"].get(str(page_number))
+    if page is None:
+        return []
+
+    cell_size = index["cell_size"]
+    candidates = set()
+    for cell in get_cells((x0, y0, x1, y1), cell_size):
+        candidates.update(page["grid"].get(cell, ()))
+
+    results = []
+    for run_id in sorted(candidates):
+        rx0, ry0, rx1, ry1, word = page["runs"][run_id]
+        if rx0 <= x1 and rx1 >= x0 and ry0 <= y1 and ry1 >= y0:
+            results.append({"run_id": run_id, "bbox": [rx0, ry0, rx1, ry1], "word": word})
+
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python pdf_word_index.py <index_file> <query>")
+        sys.exit(1)
+
+    index = load_index(sys.argv[1])
+    for hit in search(index, " ".join(sys.argv[2:])):
+        print(f"page {hit['page'] + 1}: x={hit['x']} y={hit['y']} runs={hit['run_ids']}")